@@ -0,0 +1,64 @@
+from collections import deque
+
+
+class AhoCorasick:
+    """Autômato de Aho-Corasick para busca de várias substrings de uma vez.
+
+    O autômato é construído uma única vez a partir da lista de padrões e
+    encontra todas as ocorrências em uma só passada pelo texto, com custo
+    proporcional ao tamanho do texto (e não ao número de padrões).
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]     # transições de cada estado
+        self._fail = [0]      # link de falha de cada estado
+        self._output = [()]   # padrões que terminam exatamente no estado
+        self._dict_link = [0]  # próximo estado na cadeia de falha com saída
+
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                    self._dict_link.append(0)
+                state = next_state
+            if pattern:
+                self._output[state] += (pattern_id,)
+
+        # Links de falha em largura (BFS), a partir dos filhos da raiz
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[child] = fail
+                self._dict_link[child] = fail if self._output[fail] else self._dict_link[fail]
+
+    def find_all(self, text):
+        """Retorna o conjunto de IDs dos padrões que aparecem no texto."""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        dict_link = self._dict_link
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            match = state
+            while match:
+                if output[match]:
+                    found.update(output[match])
+                match = dict_link[match]
+        return found
@@ -1,6 +1,10 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 from flask_cors import CORS
-from chatbot import chatbot
+from chatbot import chatbot, payload_chat, sessoes, chaves_api, evento_sse
+from modelo import IntentsInvalidosError
+from metrics import metricas
+from sessions import abrir_sessao, api_key_da_conversa
+import click
 import os
 
 app = Flask(__name__)
@@ -16,25 +20,132 @@ def chat():
         data = request.get_json()
         message = data.get('message', '')
         selecao_prato = data.get('selecao_prato', None)  # Para quando usuário seleciona prato
-        # Prioriza API key da variável de ambiente (Render) ou da requisição
-        api_key = os.getenv('GEMINI_API_KEY') or data.get('api_key', None)
         
         if not message:
             return jsonify({'error': 'Mensagem não fornecida'}), 400
         
+        # Estado da conversa: seleção pendente, cumprimento e pedido até agora
+        session_id, sessao = abrir_sessao(sessoes, data.get('session_id'))
+        # Prioriza API key da variável de ambiente (Render) ou da informada na conversa
+        api_key = os.getenv('GEMINI_API_KEY') or api_key_da_conversa(chaves_api, session_id, data.get('api_key'))
+        em_selecao = bool(selecao_prato) or sessao['aguardando_selecao']
+        
+        # Ranking opcional das k intenções mais prováveis por frase
+        top_k = data.get('top_k')
+        if top_k is not None and (not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 1):
+            return jsonify({'error': 'Campo "top_k" deve ser um inteiro positivo'}), 400
+        
+        # Tempos por etapa no payload, se pedido ({"debug": true} ou ?debug=1)
+        debug = bool(data.get('debug')) or request.args.get('debug', '').lower() in ('1', 'true', 'sim')
+        
         # Chama o chatbot com os parâmetros apropriados
-        result = chatbot.get_response(message, selecao_prato=selecao_prato, api_key=api_key)
-        
-        return jsonify({
-            'response': result['response'],
-            'intent': result['intent'],
-            'probability': result['probability'],
-            'all_intents': result.get('all_intents', []),
-            'all_probabilities': result.get('all_probabilities', []),
-            'sentences_processed': result.get('sentences_processed', 1),
-            'multiple_sentences': result.get('sentences_processed', 1) > 1,
-            'needs_prato_selection': result.get('needs_prato_selection', False)
-        })
+        with metricas.coletar_tempos(debug) as tempos:
+            with metricas.span('chat'):
+                result = chatbot.get_response(message, selecao_prato=selecao_prato, api_key=api_key,
+                                              sessao=sessao)
+        sessoes.put(session_id, sessao)
+        
+        payload = payload_chat(result, session_id, sessao)
+        if top_k and not em_selecao:
+            payload['ranking'] = chatbot.ranking_frases(message, top_k)
+        if tempos is not None:
+            payload['debug'] = {'tempos_ms': tempos, 'cache_classificacao': chatbot.estatisticas_cache()}
+        return jsonify(payload)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Versão do /chat em Server-Sent Events.
+    
+    O evento 'resultado' (mesmo JSON do /chat) sai assim que a mensagem é
+    classificada. Na seleção de pratos, as receitas seguem em eventos
+    'receita' ({prato, texto}) à medida que a Gemini as gera, intercaladas
+    entre os pratos, com 'receita_fim' ao fim de cada uma; receitas em cache
+    saem de uma vez. O stream termina com o evento 'fim' ou, se algo falhar
+    depois de iniciado, com 'erro' ({error}). Erros antes do stream têm a
+    mesma resposta JSON do /chat.
+    """
+    try:
+        # Corpo ausente, inválido ou que não é objeto: mesma resposta de mensagem vazia
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            data = {}
+        message = data.get('message', '')
+        selecao_prato = data.get('selecao_prato', None)
+        
+        if not message:
+            return jsonify({'error': 'Mensagem não fornecida'}), 400
+        
+        session_id, sessao = abrir_sessao(sessoes, data.get('session_id'))
+        api_key = os.getenv('GEMINI_API_KEY') or api_key_da_conversa(chaves_api, session_id, data.get('api_key'))
+        if sessao['aguardando_selecao'] and not selecao_prato:
+            selecao_prato = message.strip()
+        
+        pratos_selecionados = None
+        if selecao_prato and api_key:
+            pratos_selecionados = chatbot.processar_selecao_pratos(selecao_prato)
+            if pratos_selecionados:
+                result = chatbot.resposta_receitas_stream()
+            else:
+                result = chatbot.resposta_selecao_invalida()
+            sessao['aguardando_selecao'] = result['needs_prato_selection']
+        else:
+            result = chatbot.get_response(message, api_key=api_key, sessao=sessao)
+        sessoes.put(session_id, sessao)
+        
+        payload = payload_chat(result, session_id, sessao)
+        if pratos_selecionados:
+            payload['pratos'] = pratos_selecionados
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    def gerar():
+        try:
+            yield evento_sse('resultado', payload)
+            if pratos_selecionados:
+                with metricas.span('gemini_stream'):
+                    for prato, texto in chatbot.gemini.consultar_varios_stream(pratos_selecionados, api_key):
+                        if texto is None:
+                            yield evento_sse('receita_fim', {'prato': prato})
+                        else:
+                            yield evento_sse('receita', {'prato': prato, 'texto': texto})
+            yield evento_sse('fim', {})
+        except Exception as e:
+            # A resposta já começou: o erro vai como último evento do stream
+            yield evento_sse('erro', {'error': str(e)})
+    
+    return Response(stream_with_context(gerar()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """Classifica várias mensagens de uma vez (replays e avaliações offline)"""
+    try:
+        data = request.get_json()
+        messages = data.get('messages', [])
+        
+        if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+            return jsonify({'error': 'Campo "messages" deve ser uma lista de textos'}), 400
+        
+        results = []
+        for message, predictions in zip(messages, chatbot.predict_intents_batch(messages)):
+            intents_detected = [intent for intent, _ in predictions]
+            probabilities = [probability for _, probability in predictions]
+            # Mesma regra do /chat: a intenção principal é a de maior probabilidade
+            max_prob_idx = probabilities.index(max(probabilities))
+            results.append({
+                'message': message,
+                'intent': intents_detected[max_prob_idx],
+                'probability': round(probabilities[max_prob_idx] * 100, 2),
+                'all_intents': intents_detected,
+                'all_probabilities': [round(p * 100, 2) for p in probabilities],
+                'sentences_processed': len(predictions)
+            })
+        
+        return jsonify({'results': results})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -42,7 +153,72 @@ def chat():
 @app.route('/intents')
 def get_intents():
     """Endpoint para ver todas as intenções disponíveis"""
-    return jsonify(chatbot.intents)
+    # Serializado uma vez por modelo carregado; com If-None-Match responde 304
+    corpo, etag = chatbot.modelo_ativo().intents_json()
+    resp = Response(corpo, mimetype='application/json')
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
+
+@app.route('/metrics')
+def metrics():
+    """Métricas de latência por etapa e contadores no formato do Prometheus"""
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """Recarrega intents.json/vocabulario.json sem reiniciar o servidor"""
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token or request.headers.get('X-Admin-Token') != admin_token:
+        return jsonify({'error': 'Não autorizado'}), 403
+    
+    strict = request.args.get('strict', '').lower() in ('1', 'true', 'sim')
+    try:
+        return jsonify(chatbot.recarregar(strict=strict))
+    except IntentsInvalidosError as e:
+        return jsonify({'status': 'rejeitado', 'erros': e.erros}), 422
+    except (OSError, ValueError) as e:
+        return jsonify({'status': 'rejeitado', 'erros': [str(e)]}), 422
+
+@app.cli.command('aquecer-receitas')
+@click.option('--endpoint', default=None, help='URL base da API (ex: stub local http://localhost:8089/v1beta)')
+@click.option('--api-key', default=None, help='API key do Gemini (padrão: GEMINI_API_KEY)')
+@click.option('--force', is_flag=True, help='Consulta a API mesmo para receitas já armazenadas')
+def aquecer_receitas(endpoint, api_key, force):
+    """Pré-carrega no armazenamento as receitas de todos os pratos disponíveis."""
+    if chatbot.gemini.store is None:
+        raise click.ClickException('Armazenamento de receitas desativado (RECIPE_STORE_PATH vazio)')
+    if endpoint:
+        chatbot.gemini.base_url = endpoint.rstrip('/')
+    api_key = api_key or os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        raise click.ClickException('Informe --api-key ou defina GEMINI_API_KEY')
+    
+    pratos = chatbot.pratos_disponiveis
+    # Com GEMINI_RATE_LIMIT, as consultas esperam as fichas da chave em vez de falhar
+    resultados = chatbot.gemini.consultar_varios(pratos, api_key, usar_cache=not force, esperar_limite=True)
+    armazenados = dict(chatbot.gemini.store.pratos())
+    falhas = []
+    for prato, resultado in zip(pratos, resultados):
+        if chatbot.gemini.cache_key(prato) in armazenados:
+            click.echo(f"ok      {prato}")
+        else:
+            click.echo(f"falhou  {prato}: {resultado[:120]}")
+            falhas.append(prato)
+    if falhas:
+        raise click.ClickException(f"{len(falhas)} prato(s) não foram armazenados")
+
+@app.cli.command('invalidar-receitas')
+@click.argument('pratos', nargs=-1)
+def invalidar_receitas(pratos):
+    """Remove do armazenamento as receitas dos pratos informados (ou todas)."""
+    if chatbot.gemini.store is None:
+        raise click.ClickException('Armazenamento de receitas desativado (RECIPE_STORE_PATH vazio)')
+    if pratos:
+        removidas = sum(chatbot.gemini.store.invalidate(chatbot.gemini.cache_key(p)) for p in pratos)
+    else:
+        removidas = chatbot.gemini.store.invalidate()
+    chatbot.gemini.cache.clear()
+    click.echo(f"{removidas} receita(s) removida(s)")
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,229 @@
+"""Modo de execução assíncrono (ASGI) com o mesmo contrato do app.py.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+- A classificação de intenções (CPU) roda em um pool limitado de threads,
+  sem bloquear o event loop;
+- As consultas à Gemini usam HTTP assíncrono (httpx), sem ocupar threads;
+- Backpressure: acima de MAX_CONCURRENT requisições simultâneas o servidor
+  responde 503 imediatamente, em vez de enfileirar sem limite.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+
+from chatbot import chaves_api, chatbot, evento_sse, payload_chat, sessoes
+from gemini import AsyncGeminiClient
+from metrics import metricas
+from sessions import MemorySessionStore, abrir_sessao, api_key_da_conversa
+
+MAX_CONCURRENT = int(os.getenv('MAX_CONCURRENT', '64'))
+CLASSIFY_WORKERS = int(os.getenv('CLASSIFY_WORKERS', '4'))
+
+templates = Jinja2Templates(directory='templates')
+classify_pool = ThreadPoolExecutor(max_workers=CLASSIFY_WORKERS, thread_name_prefix='classify')
+gemini_async = AsyncGeminiClient(chatbot.gemini)
+
+
+class ConcurrencyLimiter:
+    """Limite de requisições em andamento por processo (falha rápido com 503)."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+
+    def try_acquire(self):
+        # Sem await entre o teste e o incremento: atômico dentro do event loop
+        if self.active >= self.limit:
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+
+
+limiter = ConcurrencyLimiter(MAX_CONCURRENT)
+
+
+async def em_thread_se_remoto(fn, *args):
+    """Sessões em memória são acessadas direto; num servidor remoto, em uma thread."""
+    if isinstance(sessoes, MemorySessionStore):
+        return fn(*args)
+    return await asyncio.to_thread(fn, *args)
+
+
+def servidor_ocupado():
+    return JSONResponse({'error': 'Servidor ocupado, tente novamente em instantes'},
+                        status_code=503, headers={'Retry-After': '1'})
+
+
+async def home(request):
+    return templates.TemplateResponse(request, 'home.html', {
+        'url_for': lambda name, filename: request.url_for(name, path=filename)})
+
+
+async def chat(request):
+    if not limiter.try_acquire():
+        return servidor_ocupado()
+    try:
+        data = await request.json()
+        message = data.get('message', '')
+        selecao_prato = data.get('selecao_prato', None)  # Para quando usuário seleciona prato
+
+        if not message:
+            return JSONResponse({'error': 'Mensagem não fornecida'}, status_code=400)
+
+        # Estado da conversa: seleção pendente, cumprimento e pedido até agora
+        session_id, sessao = await em_thread_se_remoto(abrir_sessao, sessoes, data.get('session_id'))
+        # Prioriza API key da variável de ambiente (Render) ou da informada na conversa
+        api_key = os.getenv('GEMINI_API_KEY') or api_key_da_conversa(chaves_api, session_id, data.get('api_key'))
+        if sessao['aguardando_selecao'] and not selecao_prato:
+            selecao_prato = message.strip()
+
+        # Ranking opcional das k intenções mais prováveis por frase
+        top_k = data.get('top_k')
+        if top_k is not None and (not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 1):
+            return JSONResponse({'error': 'Campo "top_k" deve ser um inteiro positivo'}, status_code=400)
+
+        if selecao_prato and api_key:
+            # Fluxo de ingredientes: I/O puro, aguardado direto no event loop
+            pratos_selecionados = chatbot.processar_selecao_pratos(selecao_prato)
+            if not pratos_selecionados:
+                result = chatbot.resposta_selecao_invalida()
+            else:
+                resultados = await gemini_async.consultar_varios(pratos_selecionados, api_key)
+                result = chatbot.resposta_receitas(pratos_selecionados, resultados)
+            sessao['aguardando_selecao'] = result['needs_prato_selection']
+        else:
+            # Classificação: CPU, vai para o pool de threads limitado
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                classify_pool, functools.partial(chatbot.get_response, message, api_key=api_key, sessao=sessao))
+        await em_thread_se_remoto(sessoes.put, session_id, sessao)
+
+        payload = payload_chat(result, session_id, sessao)
+        if top_k and not selecao_prato:
+            loop = asyncio.get_running_loop()
+            payload['ranking'] = await loop.run_in_executor(
+                classify_pool, chatbot.ranking_frases, message, top_k)
+        return JSONResponse(payload)
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+    finally:
+        limiter.release()
+
+
+async def chat_stream(request):
+    """Versão do /chat em Server-Sent Events (mesmos eventos do app.py, inclusive 'erro').
+
+    A vaga do limitador fica ocupada até o fim do stream.
+    """
+    if not limiter.try_acquire():
+        return servidor_ocupado()
+    liberar = True
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            data = {}
+        message = data.get('message', '')
+        selecao_prato = data.get('selecao_prato', None)
+
+        if not message:
+            return JSONResponse({'error': 'Mensagem não fornecida'}, status_code=400)
+
+        session_id, sessao = await em_thread_se_remoto(abrir_sessao, sessoes, data.get('session_id'))
+        api_key = os.getenv('GEMINI_API_KEY') or api_key_da_conversa(chaves_api, session_id, data.get('api_key'))
+        if sessao['aguardando_selecao'] and not selecao_prato:
+            selecao_prato = message.strip()
+
+        pratos_selecionados = None
+        if selecao_prato and api_key:
+            pratos_selecionados = chatbot.processar_selecao_pratos(selecao_prato)
+            if pratos_selecionados:
+                result = chatbot.resposta_receitas_stream()
+            else:
+                result = chatbot.resposta_selecao_invalida()
+            sessao['aguardando_selecao'] = result['needs_prato_selection']
+        else:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                classify_pool, functools.partial(chatbot.get_response, message, api_key=api_key, sessao=sessao))
+        await em_thread_se_remoto(sessoes.put, session_id, sessao)
+
+        payload = payload_chat(result, session_id, sessao)
+        if pratos_selecionados:
+            payload['pratos'] = pratos_selecionados
+
+        async def gerar():
+            try:
+                yield evento_sse('resultado', payload)
+                if pratos_selecionados:
+                    async for prato, texto in gemini_async.consultar_varios_stream(pratos_selecionados, api_key):
+                        if texto is None:
+                            yield evento_sse('receita_fim', {'prato': prato})
+                        else:
+                            yield evento_sse('receita', {'prato': prato, 'texto': texto})
+                yield evento_sse('fim', {})
+            except Exception as e:
+                # A resposta já começou: o erro vai como último evento do stream
+                yield evento_sse('erro', {'error': str(e)})
+            finally:
+                limiter.release()
+
+        liberar = False   # o gerador libera a vaga ao terminar
+        return StreamingResponse(gerar(), media_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+    finally:
+        if liberar:
+            limiter.release()
+
+
+async def get_intents(request):
+    """Endpoint para ver todas as intenções disponíveis"""
+    # Serializado uma vez por modelo carregado; com If-None-Match responde 304
+    corpo, etag = chatbot.modelo_ativo().intents_json()
+    headers = {'ETag': f'"{etag}"'}
+    if request.headers.get('if-none-match') == headers['ETag']:
+        return Response(status_code=304, headers=headers)
+    return Response(corpo, media_type='application/json', headers=headers)
+
+
+async def metrics(request):
+    """Métricas no formato do Prometheus (mesmas do app.py)"""
+    return PlainTextResponse(metricas.exportar(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def shutdown():
+    await gemini_async.aclose()
+    classify_pool.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/', home),
+        Route('/chat', chat, methods=['POST']),
+        Route('/chat/stream', chat_stream, methods=['POST']),
+        Route('/intents', get_intents),
+        Route('/metrics', metrics),
+        Mount('/static', StaticFiles(directory='static'), name='static'),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    on_shutdown=[shutdown],
+)
@@ -0,0 +1,396 @@
+"""Benchmarks dos caminhos críticos do chatbot.
+
+Mede vazão (ops/s), latência (p50/p99) e alocações (tracemalloc) de:
+preprocess_text, predict_intent, keyword_fallback, extract_prato,
+get_response (uma e várias frases) e /chat pelo test client do Flask, com a
+API Gemini substituída pelo stub local. Os resultados ficam em JSON para
+comparação automática (ex: no CI):
+
+    python benchmark.py run --out bench.json      # cada caso sem e com os caches
+    python benchmark.py run --escala 1 10 100 --out bench.json   # corpus sintético
+    python benchmark.py compare base.json bench.json --limite 0.15
+    python benchmark.py corpus --escala 10 --out intents_x10.json
+    python benchmark.py fuzzy      # correção de digitação: acerto, latência e desconto na confiança
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# Receitas só em memória: o benchmark não deve gravar no receitas.db
+os.environ.setdefault('RECIPE_STORE_PATH', '')
+
+# Frases de teste do README
+FRASES_SIMPLES = [
+    "Olá, quero pedir sushi de salmão",
+    "Oi, quanto custa o temaki?",
+    "Quero hot roll",
+    "Preciso de yakissoba",
+    "Gostaria de philadelphia",
+    "Vou querer califórnia",
+    "Meu pedido chegou frio",
+    "O sushi veio mal feito",
+    "Demorou muito para entregar",
+    "Muito obrigado",
+    "Valeu pela ajuda",
+    "Arigato!",
+    "Tchau",
+    "Até logo",
+    "Sayonara",
+]
+
+FRASES_MULTIPLAS = [
+    "Olá! Quero fazer um pedido. Gostaria de saber o preço do combo família.",
+    "Boa noite, quero sushi de atum e também gostaria de saber o tempo de entrega.",
+    "Oi, preciso fazer um pedido urgente, quero combo salmão, quanto custa e em quanto tempo chega?",
+    "Bom dia! Quero ver o cardápio, principalmente os preços dos temakis, e também saber sobre tempo de entrega.",
+]
+
+# Erros de digitação comuns, com o prato que deveria ser reconhecido
+FRASES_COM_ERROS = [
+    ("yakisobaa", "yakisoba"),
+    ("temakki", "temaki"),
+    ("sashim", "sashimi"),
+    ("quero um temakki de salmao", "temaki salmao"),
+    ("quanto custa o udom?", "udon"),
+    ("vou querer gyosa", "gyoza"),
+    ("quero um hot rolll", "hot roll"),
+    ("tem philadelfia?", "philadelphia"),
+    ("quero um ramenn", "ramen"),
+    ("me ve um tenpura", "tempura"),
+    ("quero sushi de salmaoo", "sushi de salmão"),
+    ("qual o preço do combo familai", "combo familia"),
+    ("quero teriyaky", "teriyaki"),
+    ("yakissobba de frango", "yakissoba de frango"),
+    ("quero missoshiro", "missoshiru"),
+    ("obrigadoo", None),
+    ("tchauu", None),
+    ("qual o cardapoi", None),
+]
+
+# (com erro, corrigida): a correção leva à mesma intenção, com confiança menor
+FRASES_CORRIGIDAS = [
+    ("carro", "caro"),
+    ("sashim", "sashimi"),
+    ("obrigadoo", "obrigado"),
+    ("tchauu", "tchau"),
+]
+
+SILABAS = ['ka', 'ki', 'ku', 'ke', 'ko', 'sa', 'shi', 'su', 'ta', 'to', 'na', 'no', 'ma', 'mi', 'ra', 'ro', 'ya', 'yo']
+
+
+def gerar_corpus(intents, escala, seed=42):
+    """Multiplica o intents.json por `escala` com intenções sintéticas.
+
+    Cada cópia k ganha tags novas (ex: compra_sint3) e padrões em que parte
+    das palavras recebe um sufixo sintético, para o vocabulário crescer junto
+    com o número de padrões. As intenções originais vêm primeiro, então as
+    frases reais continuam classificadas nelas.
+    """
+    rng = random.Random(seed)
+    gerado = [dict(intent) for intent in intents['intents']]
+    for k in range(1, escala):
+        sufixo = ''.join(rng.choice(SILABAS) for _ in range(2)) + str(k)
+        for intent in intents['intents']:
+            patterns = []
+            for pattern in intent['patterns']:
+                words = [w + sufixo if len(w) > 3 and rng.random() < 0.5 else w for w in pattern.split()]
+                patterns.append(' '.join(words))
+            gerado.append({
+                'tag': f"{intent['tag']}_sint{k}",
+                'patterns': patterns,
+                'responses': intent['responses'],
+            })
+    return {'intents': gerado}
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    idx = min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))
+    return valores[idx]
+
+
+def medir(fn, entradas, iteracoes, preparar=None, amostras_alocacao=200):
+    """Executa fn sobre as entradas (em ciclo) e mede tempo e alocações.
+
+    `preparar` roda antes de cada operação, fora da medição.
+    """
+    def executar(i):
+        if preparar:
+            preparar()
+        entrada = entradas[i % len(entradas)]
+        inicio = time.perf_counter_ns()
+        fn(entrada)
+        return time.perf_counter_ns() - inicio
+
+    for i in range(min(len(entradas), iteracoes)):   # aquecimento
+        executar(i)
+
+    latencias = [executar(i) for i in range(iteracoes)]
+
+    # Alocações em uma passada separada: o tracemalloc distorce os tempos
+    picos = []
+    tracemalloc.start()
+    for i in range(min(iteracoes, amostras_alocacao)):
+        if preparar:
+            preparar()
+        atual, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn(entradas[i % len(entradas)])
+        picos.append(tracemalloc.get_traced_memory()[1] - atual)
+    tracemalloc.stop()
+
+    total_s = sum(latencias) / 1e9
+    return {
+        'ops': iteracoes,
+        'ops_s': round(iteracoes / total_s, 1),
+        'p50_us': round(percentil(latencias, 50) / 1000, 1),
+        'p99_us': round(percentil(latencias, 99) / 1000, 1),
+        'alloc_kb_medio': round(sum(picos) / len(picos) / 1024, 2),
+        'alloc_kb_max': round(max(picos) / 1024, 2),
+    }
+
+
+def casos(chatbot, client, padroes):
+    """Casos do benchmark: nome -> (função, entradas, preparar)."""
+    frases = FRASES_SIMPLES + random.Random(7).sample(padroes, min(200, len(padroes)))
+
+    def chat(mensagem):
+        resp = client.post('/chat', json=mensagem)
+        assert resp.status_code == 200, resp.get_data(as_text=True)
+
+    return {
+        'preprocess_text': (chatbot.preprocess_text, frases, None),
+        'predict_intent': (chatbot.predict_intent, frases, None),
+        'keyword_fallback': (lambda s: chatbot.keyword_fallback(s.lower()), frases, None),
+        'extract_prato': (chatbot.extract_prato, frases, None),
+        'predict_intent_erros': (chatbot.predict_intent, [f for f, _ in FRASES_COM_ERROS], None),
+        'extract_prato_erros': (chatbot.extract_prato, [f for f, _ in FRASES_COM_ERROS], None),
+        'get_response_simples': (chatbot.get_response, FRASES_SIMPLES, None),
+        'get_response_multiplas': (chatbot.get_response, FRASES_MULTIPLAS, None),
+        'chat_flask': (chat, [{'message': m} for m in FRASES_SIMPLES + FRASES_MULTIPLAS], None),
+        # Seleção de pratos com receitas vindas do stub (cache limpo a cada operação)
+        'chat_receitas': (chat, [{'message': '1,6', 'selecao_prato': '1,6', 'api_key': 'stub'}],
+                          chatbot.gemini.cache.clear),
+    }
+
+
+@contextmanager
+def caches_desativados(chatbot):
+    """Desliga os caches do pré-processamento, da classificação e do corretor
+    ortográfico do modelo atual, para medir o pipeline inteiro a cada operação."""
+    from tokenizer import PreProcessador
+
+    modelo = chatbot.modelo
+    preprocessador, classificacoes = chatbot.preprocessador, modelo.classificacoes
+    corretor = modelo.corretor
+    corrigir = corretor.corrigir if corretor is not None else None
+    chatbot.preprocessador = PreProcessador(chatbot.stop_words, chatbot.tokenizador, cache_size=0)
+    modelo.classificacoes = None
+    if corretor is not None:
+        corretor.corrigir = corretor._corrigir
+    try:
+        yield
+    finally:
+        chatbot.preprocessador, modelo.classificacoes = preprocessador, classificacoes
+        if corretor is not None:
+            corretor.corrigir = corrigir
+
+
+def executar_benchmarks(escalas, iteracoes, sem_cache=False):
+    """Mede cada caso sem os caches (nome do caso) e, com eles, em `<caso> [cache]`.
+
+    Os números sem cache são os que pegam regressões na tokenização e na
+    pontuação; os com cache mostram o ganho para mensagens repetidas. Com
+    sem_cache=True, só a primeira parte.
+    """
+    from chatbot import chatbot
+    from app import app
+    from gemini_stub import start_stub_server
+    from modelo import Modelo
+
+    random.seed(0)
+    modos = [('', True)] if sem_cache else [('', True), (' [cache]', False)]
+
+    stub = start_stub_server()
+    chatbot.gemini.base_url = stub.base_url
+    client = app.test_client()
+
+    original = chatbot.modelo
+    # Mesmas frases em todas as escalas: padrões do intents.json real
+    padroes = [p for intent in original.intents['intents'] for p in intent['patterns']]
+    resultados = {}
+    try:
+        for escala in escalas:
+            if escala > 1:
+                inicio = time.perf_counter()
+                intents = gerar_corpus(original.intents, escala)
+                chatbot.modelo = Modelo.from_json(intents, original.vocabulario, chatbot.preprocess_text)
+                print(f"[escala {escala}x] {len(chatbot.index.pattern_sets)} padrões, "
+                      f"{len(chatbot.index.vocab)} tokens, compilado em {time.perf_counter() - inicio:.1f}s",
+                      file=sys.stderr)
+            else:
+                chatbot.modelo = original
+            resultados[str(escala)] = {}
+            for sufixo, desativar in modos:
+                with caches_desativados(chatbot) if desativar else nullcontext():
+                    for nome, (fn, entradas, preparar) in casos(chatbot, client, padroes).items():
+                        n = iteracoes if preparar is None else max(1, iteracoes // 20)
+                        r = resultados[str(escala)][nome + sufixo] = medir(fn, entradas, n, preparar)
+                        print(f"[{escala:>3}x] {nome + sufixo:32} {r['ops_s']:>10.1f} ops/s  "
+                              f"p50 {r['p50_us']:>9.1f}us  p99 {r['p99_us']:>9.1f}us  "
+                              f"alloc {r['alloc_kb_medio']:>8.2f}KB", file=sys.stderr)
+    finally:
+        chatbot.modelo = original
+        stub.shutdown()
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+            'tokenizador': chatbot.tokenizador.nome,
+            'sem_cache': sem_cache,
+            'iteracoes': iteracoes,
+            'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'escalas': resultados,
+    }
+
+
+def avaliar_correcao(iteracoes):
+    """Acerto e latência de predict_intent + extract_prato com e sem a correção de digitação.
+
+    Mede as frases com erros (FRASES_COM_ERROS) e as frases corretas do
+    README, para mostrar que o caminho comum não fica mais lento. Com a
+    correção, confere também que cada frase de FRASES_CORRIGIDAS chega à
+    intenção da versão correta com score menor (em 'desconto_falhas').
+    """
+    from chatbot import chatbot
+
+    modelo = chatbot.modelo
+    habilitado = modelo.fuzzy
+    corretas = FRASES_SIMPLES + FRASES_MULTIPLAS
+    com_erros = [f for f, _ in FRASES_COM_ERROS]
+
+    def classificar(frase):
+        return chatbot.predict_intent(frase), chatbot.extract_prato(frase)
+
+    resultado = {}
+    try:
+        for nome, fuzzy in (('atual', False), ('fuzzy', True)):
+            modelo.fuzzy = fuzzy
+            respostas = [classificar(f) for f, _ in FRASES_COM_ERROS]
+            pratos_esperados = [(prato, esperado) for (_, prato), (_, esperado) in zip(respostas, FRASES_COM_ERROS)
+                                if esperado is not None]
+            resultado[nome] = {
+                'pratos_corretos': sum(prato == esperado for prato, esperado in pratos_esperados),
+                'pratos_esperados': len(pratos_esperados),
+                'desconhecido': sum(intent == 'desconhecido' for (intent, _), _ in respostas),
+                'com_erros': medir(classificar, com_erros, iteracoes),
+                'corretas': medir(classificar, corretas, iteracoes),
+            }
+            r = resultado[nome]
+            print(f"{nome:6} pratos {r['pratos_corretos']}/{r['pratos_esperados']}  "
+                  f"desconhecido {r['desconhecido']}/{len(FRASES_COM_ERROS)}  "
+                  f"com erros p50 {r['com_erros']['p50_us']:.1f}us p99 {r['com_erros']['p99_us']:.1f}us  "
+                  f"corretas p50 {r['corretas']['p50_us']:.1f}us p99 {r['corretas']['p99_us']:.1f}us",
+                  file=sys.stderr)
+
+        modelo.fuzzy = True
+        falhas = []
+        for errada, correta in FRASES_CORRIGIDAS:
+            (intent, score), (esperada, score_exato) = chatbot.predict_intent(errada), chatbot.predict_intent(correta)
+            ok = intent == esperada and score < score_exato
+            print(f"{'ok' if ok else 'FALHA':5} {errada!r} -> {intent} {score:.2f}  "
+                  f"{correta!r} -> {esperada} {score_exato:.2f}", file=sys.stderr)
+            if not ok:
+                falhas.append(errada)
+        resultado['desconto_falhas'] = falhas
+    finally:
+        modelo.fuzzy = habilitado
+    return resultado
+
+
+def comparar(base, atual, limite):
+    """Compara dois resultados; retorna a lista de regressões acima do limite.
+
+    Regressão: queda de ops/s ou aumento do p50 maior que `limite` (fração).
+    O p99 é só informativo (ruidoso demais para reprovar um build).
+    """
+    regressoes = []
+    for escala, casos_atuais in atual['escalas'].items():
+        for nome, r in casos_atuais.items():
+            b = base['escalas'].get(escala, {}).get(nome)
+            if b is None:
+                continue
+            vazao = r['ops_s'] / b['ops_s'] - 1
+            p50 = r['p50_us'] / b['p50_us'] - 1 if b['p50_us'] else 0.0
+            p99 = r['p99_us'] / b['p99_us'] - 1 if b['p99_us'] else 0.0
+            regrediu = vazao < -limite or p50 > limite
+            print(f"{'REGRESSÃO' if regrediu else 'ok':9} [{escala:>3}x] {nome:24} "
+                  f"ops/s {vazao:+7.1%}  p50 {p50:+7.1%}  p99 {p99:+7.1%}")
+            if regrediu:
+                regressoes.append((escala, nome))
+    return regressoes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks dos caminhos críticos do chatbot')
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    run = sub.add_parser('run', help='executa os benchmarks')
+    run.add_argument('--escala', type=int, nargs='+', default=[1], help='multiplicadores do corpus (ex: 1 10 100)')
+    run.add_argument('--iteracoes', type=int, default=2000)
+    run.add_argument('--sem-cache', action='store_true', help='mede só sem os caches (padrão: sem e com, lado a lado)')
+    run.add_argument('--out', help='arquivo JSON de saída (padrão: stdout)')
+
+    cmp = sub.add_parser('compare', help='compara dois resultados e falha se houver regressão')
+    cmp.add_argument('base')
+    cmp.add_argument('atual')
+    cmp.add_argument('--limite', type=float, default=0.15, help='fração tolerada (padrão 0.15)')
+
+    corpus = sub.add_parser('corpus', help='gera um intents.json sintético maior')
+    corpus.add_argument('--escala', type=int, default=10)
+    corpus.add_argument('--out', required=True)
+
+    fuzzy = sub.add_parser('fuzzy', help='compara o acerto e a latência com e sem a correção de digitação')
+    fuzzy.add_argument('--iteracoes', type=int, default=2000)
+
+    args = parser.parse_args()
+
+    if args.comando == 'run':
+        resultado = executar_benchmarks(args.escala, args.iteracoes, args.sem_cache)
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as f:
+                json.dump(resultado, f, indent=2, ensure_ascii=False)
+        else:
+            print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    elif args.comando == 'compare':
+        with open(args.base, encoding='utf-8') as f:
+            base = json.load(f)
+        with open(args.atual, encoding='utf-8') as f:
+            atual = json.load(f)
+        regressoes = comparar(base, atual, args.limite)
+        if regressoes:
+            print(f"{len(regressoes)} regressão(ões) acima de {args.limite:.0%}")
+            sys.exit(1)
+    elif args.comando == 'fuzzy':
+        resultado = avaliar_correcao(args.iteracoes)
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+        if resultado['desconto_falhas']:
+            print(f"{len(resultado['desconto_falhas'])} correção(ões) sem desconto na confiança")
+            sys.exit(1)
+    else:
+        with open('intents.json', 'r', encoding='utf-8') as f:
+            intents = json.load(f)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(gerar_corpus(intents, args.escala), f, ensure_ascii=False, indent=2)
+        print(f"{args.out}: {args.escala}x intents.json")
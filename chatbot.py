@@ -1,32 +1,86 @@
 import json
 import random
 import re
-import nltk
 import os
-import requests
 from collections import Counter
 import math
+from gemini import GeminiClient
+from recipe_store import store_from_env
+from worker_pool import ClassificadorPool
+from model_artifact import carregar_artefato
+from modelo import Modelo, MonitorArquivos, preparar_resposta, validar_intents
+from tokenizer import PreProcessador, criar_tokenizador
+from fuzzy import DESCONTO_CORRECAO
+from metrics import metricas
+from sessions import adicionar_ao_pedido, chaves_api_from_env, session_store_from_env
+from contextlib import contextmanager
+import functools
+import threading
 
-# Download necessário do NLTK
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+def garantir_recursos_nltk(punkt=False):
+    """Download necessário do NLTK (só quando o modelo é compilado do JSON)"""
+    # Importado só aqui: com o artefato compilado o NLTK nem é carregado
+    import nltk
+    if punkt:
+        try:
+            nltk.data.find('tokenizers/punkt')
+        except LookupError:
+            nltk.download('punkt')
+
+    try:
+        nltk.data.find('corpora/stopwords')
+    except LookupError:
+        nltk.download('stopwords')
 
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
+def _com_modelo_fixo(metodo):
+    """Executa o método inteiro com o mesmo snapshot do modelo"""
+    @functools.wraps(metodo)
+    def wrapper(self, *args, **kwargs):
+        with self.fixar_modelo():
+            return metodo(self, *args, **kwargs)
+    return wrapper
 
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+def _do_modelo(nome):
+    """Atributo lido do snapshot do modelo ativo (ver fixar_modelo)"""
+    return property(lambda self: getattr(self.modelo_ativo(), nome))
 
 class RestauranteJaponesChatbotSimples:
-    def __init__(self):
-        self.intents = self.load_intents()
-        self.stop_words = set(stopwords.words('portuguese'))
-        # Adiciona algumas palavras em inglês também
-        self.stop_words.update(['the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'])
+    # Estado compilado: vem do snapshot, trocado por inteiro no recarregamento
+    intents = _do_modelo('intents')
+    index = _do_modelo('index')
+    vocabulario = _do_modelo('vocabulario')
+    matcher = _do_modelo('matcher')
+    prato_rank = _do_modelo('prato_rank')
+    keyword_tags = _do_modelo('keyword_tags')
+    keyword_hits = _do_modelo('keyword_hits')
+    corretor = _do_modelo('corretor')
+
+    def __init__(self, model_path=None):
+        self._local = threading.local()
+        self._reload_lock = threading.Lock()
+        # Tokenizador do pré-processamento (TOKENIZER=regex, padrão, ou nltk)
+        self.tokenizador = criar_tokenizador()
+        
+        # Usa o artefato compilado (modelo.bin) se existir e estiver em dia;
+        # senão compila o modelo a partir do intents.json
+        if model_path is None:
+            model_path = os.getenv('MODEL_PATH', 'modelo.bin')
+        artefato = carregar_artefato(model_path, tokenizador=self.tokenizador.nome)
+        
+        if artefato is not None:
+            self.stop_words = artefato.stop_words()
+            self.preprocessador = PreProcessador(self.stop_words, self.tokenizador)
+            self.modelo = Modelo.from_artifact(artefato)
+        else:
+            garantir_recursos_nltk(punkt=self.tokenizador.nome == 'nltk')
+            from nltk.corpus import stopwords
+            self.stop_words = set(stopwords.words('portuguese'))
+            # Adiciona algumas palavras em inglês também
+            self.stop_words.update(['the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'])
+            self.preprocessador = PreProcessador(self.stop_words, self.tokenizador)
+            self.modelo = Modelo.from_json(self.load_intents(), self.load_vocabulario(), self.preprocess_text)
+            self.modelo.corretor  # já compilando tudo: monta também o corretor ortográfico
+        
         # Lista de pratos disponíveis para consulta de ingredientes
         self.pratos_disponiveis = [
             "lasanha", "feijoada", "moqueca", "spaghetti alla carbonara",
@@ -34,114 +88,99 @@ class RestauranteJaponesChatbotSimples:
             "combo família", "sushi de atum", "sashimi", "udon", "teriyaki",
             "philadelphia roll", "califórnia roll", "gyoza", "tempura"
         ]
+        # Cliente Gemini com pool de conexões, cache de receitas e single-flight,
+        # lendo antes o armazenamento persistente de receitas
+        self.gemini = GeminiClient(store=store_from_env())
+        # Pool de processos opcional para a classificação (ver usar_pool)
+        self.pool = None
+    
+    def modelo_ativo(self):
+        """Snapshot fixado para a requisição desta thread, ou o atual"""
+        return getattr(self._local, 'modelo', None) or self.modelo
+    
+    @contextmanager
+    def fixar_modelo(self):
+        """Fixa o snapshot atual durante uma requisição inteira.
+        
+        Um recarregamento no meio do processamento não afeta a requisição:
+        ela termina com o mesmo modelo com que começou.
+        """
+        if getattr(self._local, 'modelo', None) is not None:
+            yield self._local.modelo
+            return
+        self._local.modelo = self.modelo
+        try:
+            yield self._local.modelo
+        finally:
+            self._local.modelo = None
+    
+    def recarregar(self, strict=False):
+        """Recarrega intents.json e vocabulario.json sem reiniciar o servidor.
+        
+        O novo modelo é validado e compilado à parte e só então substitui o
+        atual, em uma única atribuição. Se a validação falhar, levanta
+        IntentsInvalidosError e o modelo em produção continua intacto.
+        Retorna um resumo com os avisos da validação.
+        """
+        with self._reload_lock:
+            intents = self.load_intents()
+            vocabulario = self.load_vocabulario()
+            avisos = validar_intents(intents, self.preprocess_text, strict=strict)
+            novo = Modelo.from_json(intents, vocabulario, self.preprocess_text)
+            novo.corretor  # monta o corretor antes da troca, fora do caminho das requisições
+            if self.pool is not None:
+                # Os workers herdaram o modelo antigo no fork: grava o novo em um
+                # artefato, que eles carregam sob demanda (sem novo fork)
+                self.pool.preparar(novo)
+            self.modelo = novo
+        return {
+            'status': 'ok',
+            'intents': len(novo.index.tags),
+            'patterns': len(novo.index.pattern_sets),
+            'avisos': avisos
+        }
     
     def consulta_gemini(self, nome_prato, api_key):
         """Consulta a API Gemini para obter ingredientes/receita do prato."""
-        url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
-        headers = {
-            "Content-Type": "application/json",
-        }
-        prompt = f"Quais são os ingredientes e a receita completa do prato {nome_prato}? Forneça uma receita detalhada com todos os ingredientes e modo de preparo."
-        payload = {
-            "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "temperature": 0.7,
-                "maxOutputTokens": 1024
-            }
-        }
-        params = {"key": api_key}
-        try:
-            resp = requests.post(url, headers=headers, params=params, json=payload, timeout=30)
-            resp.raise_for_status()
-            j = resp.json()
-            # Ajuste conforme o formato retornado pela Gemini
-            content = j.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text")
-            if not content:
-                return f"Receita de {nome_prato}:\n\nA API não retornou conteúdo válido. Resposta completa: {json.dumps(j, ensure_ascii=False, indent=2)}"
-            return content
-        except requests.exceptions.RequestException as e:
-            return f"Erro ao consultar a API Gemini: {str(e)}"
-        except Exception as e:
-            return f"Erro inesperado: {str(e)}"
+        with metricas.span('gemini'):
+            return self.gemini.consultar(nome_prato, api_key)
 
     def extract_prato(self, text):
         """Extrai o prato japonês da frase, considerando variações e erros comuns."""
-        pratos = [
-            # Sushis tradicionais (ordem por especificidade)
-            "philadelphia", "filadélfia", "cream cheese philadelphia",
-            "sushi de salmão", "sushi salmão", "salmão", "salmao", "salmon", "sake",
-            "sushi de atum", "sushi atum", "atum", "tuna", "maguro",
-            "sushi de kani", "sushi kani", "kani", "caranguejo", "surimi",
-            
-            # Temakis especiais
-            "temaki hot philadelphia", "hot philadelphia", "hot roll",
-            "temaki salmão grelhado", "salmão grelhado", "salmao grelhado", "grilled salmon",
-            "temaki califórnia", "temaki california", "califórnia", "california", "california roll",
-            "temaki atum spicy", "atum spicy", "spicy tuna", "spicy",
-            "temaki salmão", "temaki salmao", 
-            "temaki atum", "temaki kani", "temaki",
+        with metricas.span('extrair_prato'):
+            text = text.lower()
+            pratos_encontrados = [i for i in self.matcher.find_all(text) if i in self.prato_rank]
             
-            # Pratos quentes
-            "yakissoba de frango", "yakissoba frango", "yakissoba carne", "yakissoba misto",
-            "yakissoba", "yakisoba", "yaki soba", "macarrão japonês",
-            "udon de frango", "udon carne", "udon vegetariano", "udon",
-            "macarrão udon", "sopa udon",
-            "teriyaki chicken", "frango teriyaki", "chicken teriyaki", "teriyaki",
-            "ramen", "lamen", "missoshiru", "miso soup", "sopa de miso",
-            "gyoza", "guioza", "tempura", "tempora",
+            # Nenhum prato: tenta de novo com os erros de digitação corrigidos ("temakki")
+            corretor = self.corretor
+            if not pratos_encontrados and corretor is not None:
+                corrigido = corretor.corrigir_texto(text)
+                if corrigido is not None:
+                    pratos_encontrados = [i for i in self.matcher.find_all(corrigido) if i in self.prato_rank]
+                    if pratos_encontrados:
+                        metricas.contar('chatbot_correcao_total', etapa='prato')
             
-            # Combinados e especiais
-            "combo família", "combo familia", "combo family",
-            "combo salmão", "combo salmao", "combo salmon",
-            "combo misto", "combo mix", "combo variado",
-            "combo atum", "combo tuna",
-            "combo executivo", "combo especial", "combo premium",
-            "combinado", "combo", "rodízio", "festival",
+            # Retorna o prato mais específico (mais longo); empate fica com o primeiro da lista
+            if pratos_encontrados:
+                melhor = min(pratos_encontrados, key=self.prato_rank.__getitem__)
+                return self.matcher.patterns[melhor]
             
-            # Sashimi
-            "sashimi de salmão", "sashimi salmão", "sashimi salmao",
-            "sashimi de atum", "sashimi atum", "sashimi tuna",
-            "sashimi misto", "sashimi mix", "sashimi",
-            
-            # Gunkan e outros
-            "gunkan salmão", "gunkan atum", "gunkan ikura", "gunkan",
-            "joe salmão", "joe atum", "joe",
-            "skin salmão", "skin salmon", "skin",
-            
-            # Opções especiais
-            "vegetariano", "vegano", "vegan", "sem peixe", "sem carne",
-            "sem glúten", "diet", "light", "fitness"
-        ]
-        
-        text_lower = text.lower()
-        pratos_encontrados = []
-        
-        # Busca por pratos, priorizando os mais específicos
-        for prato in pratos:
-            if prato in text_lower:
-                pratos_encontrados.append(prato)
-        
-        # Retorna o prato mais específico (mais longo)
-        if pratos_encontrados:
-            pratos_encontrados.sort(key=len, reverse=True)
-            return pratos_encontrados[0]
-        
-        return None
+            return None
 
     def load_intents(self):
         """Carrega as intenções do arquivo intents.json"""
         with open('intents.json', 'r', encoding='utf-8') as f:
             return json.load(f)
+
+    def load_vocabulario(self):
+        """Carrega apelidos de pratos e palavras-chave do arquivo vocabulario.json"""
+        with open('vocabulario.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
     
     def preprocess_text(self, text):
         """Pré-processa o texto removendo pontuação e palavras irrelevantes"""
-        # Remove pontuação e converte para minúsculo
-        text = re.sub(r'[^\w\s]', '', text.lower())
-        # Tokeniza
-        words = word_tokenize(text, language='portuguese')
-        # Remove stop words
-        words = [word for word in words if word not in self.stop_words and len(word) > 2]
-        return words
+        # Tokenização e filtro de stop words com cache por texto (ver tokenizer.py)
+        return list(self.preprocessador.processar(text))
     
     def calculate_similarity(self, text1_words, text2_words):
         """Calcula similaridade entre duas listas de palavras usando Jaccard"""
@@ -161,74 +200,110 @@ class RestauranteJaponesChatbotSimples:
     
     def predict_intent(self, message):
         """Prediz a intenção da mensagem usando similaridade de palavras"""
-        message_words = self.preprocess_text(message)
+        return self.rank_intents(message, 1)[0]
+    
+    def rank_intents(self, message, k=1):
+        """Retorna as k intenções mais prováveis como (intenção, score).
         
-        best_intent = "desconhecido"
-        best_score = 0.0
+        A primeira é sempre a de predict_intent. Quando a similaridade é baixa
+        demais, a lista traz só o resultado do fallback por palavras-chave.
+        """
+        with metricas.span('preprocessar'):
+            message_words = self.preprocess_text(message)
         
-        for intent in self.intents['intents']:
-            max_similarity = 0.0
-            
-            for pattern in intent['patterns']:
-                pattern_words = self.preprocess_text(pattern)
-                similarity = self.calculate_similarity(message_words, pattern_words)
-                
-                if similarity > max_similarity:
-                    max_similarity = similarity
-            
-            if max_similarity > best_score:
-                best_score = max_similarity
-                best_intent = intent['tag']
+        # Ranking com parada antecipada: mesmo resultado da pontuação exaustiva
+        with metricas.span('pontuar_intencao'):
+            ranking = self.index.ranking(message_words, k)
         
-        # Se a similaridade for muito baixa, tenta busca por palavras-chave
-        if best_score < 0.1:
-            best_intent, best_score = self.keyword_fallback(message.lower())
+        # Se a similaridade for muito baixa, tenta corrigir a digitação e as palavras-chave
+        if not ranking or ranking[0][1] < 0.1:
+            return self.fallback(message, message_words, k)
         
-        return best_intent, best_score
+        return ranking
+    
+    def fallback(self, message, message_words, k=1):
+        """Ranking de uma frase com similaridade baixa demais.
+        
+        Primeiro corrige as palavras desconhecidas ("yakisobaa", "sashim") e
+        pontua de novo; se ainda assim não passar do limite, usa a busca por
+        palavras-chave (no texto original e, sem resultado, no corrigido).
+        Resultados obtidos com a correção têm o score multiplicado por
+        DESCONTO_CORRECAO: "carro" corrigido para "caro" não tem a mesma
+        confiança de quem digitou "caro".
+        """
+        corretor = self.corretor
+        if corretor is not None:
+            with metricas.span('corrigir_digitacao'):
+                corrigidas = corretor.corrigir_palavras(message_words)
+                ranking = self.index.ranking(corrigidas, k) if corrigidas else None
+            if ranking and ranking[0][1] >= 0.1:
+                metricas.contar('chatbot_correcao_total', etapa='intencao')
+                return [(intent, score * DESCONTO_CORRECAO) for intent, score in ranking]
+        
+        metricas.contar('chatbot_fallback_total')
+        with metricas.span('fallback_palavras'):
+            texto = message.lower()
+            resultado = self.keyword_fallback(texto)
+            if resultado[0] == "desconhecido" and corretor is not None:
+                corrigido = corretor.corrigir_texto(texto)
+                if corrigido is not None:
+                    intent, score = self.keyword_fallback(corrigido)
+                    resultado = intent, score * DESCONTO_CORRECAO
+        return [resultado]
+    
+    @_com_modelo_fixo
+    def ranking_frases(self, message, k):
+        """Ranking das k intenções mais prováveis de cada frase da mensagem"""
+        return [{
+            'sentence': sentence,
+            'intents': [{'intent': intent, 'probability': round(score * 100, 2)}
+                        for intent, score in self.rank_intents(sentence, k)]
+        } for sentence in self.split_sentences(message.strip())]
+    
+    @_com_modelo_fixo
+    def predict_intents_batch(self, messages):
+        """Classifica várias mensagens de uma vez (modo vetorizado).
+
+        Todas as frases de todas as mensagens são pontuadas juntas contra a
+        matriz de padrões. Retorna, para cada mensagem, a lista de tuplas
+        (intenção, score) de cada frase, idêntica ao que predict_intent
+        retornaria frase a frase.
+        """
+        sentences_per_message = [self.split_sentences(message.strip()) for message in messages]
+        sentences = [s for message_sentences in sentences_per_message for s in message_sentences]
+        words = [self.preprocess_text(s) for s in sentences]
+        scores = self.index.batch_intent_scores(words)
+
+        predictions = []
+        for sentence, sentence_words, row in zip(sentences, words, scores):
+            best = int(row.argmax()) if len(row) else 0
+            if len(row) and row[best] > 0.0:
+                best_intent, best_score = self.index.tags[best], float(row[best])
+            else:
+                best_intent, best_score = "desconhecido", 0.0
+            # Mesmo critério de predict_intent para o fallback por palavras-chave
+            if best_score < 0.1:
+                best_intent, best_score = self.fallback(sentence, sentence_words)[0]
+            predictions.append((best_intent, best_score))
+
+        results = []
+        position = 0
+        for message_sentences in sentences_per_message:
+            results.append(predictions[position:position + len(message_sentences)])
+            position += len(message_sentences)
+        return results
     
     def keyword_fallback(self, message):
         """Busca por palavras-chave específicas se a similaridade for baixa"""
-        keywords = {
-            'cumprimento': ['oi', 'olá', 'ola', 'hello', 'hey', 'bom dia', 'boa tarde', 'boa noite'],
-            'compra': [
-                'quero', 'pedir', 'comprar', 'pedido', 'vou querer',
-                # Sushis
-                'salmão', 'salmao', 'salmon', 'sake',
-                'atum', 'tuna', 'maguro',
-                'kani', 'caranguejo', 'surimi',
-                'philadelphia', 'filadélfia', 'cream cheese',
-                # Temakis
-                'temaki', 'temaki salmão', 'temaki atum', 'temaki kani',
-                'hot roll', 'hot philadelphia', 'hot', 'hott',
-                'califórnia', 'california', 'california roll',
-                'atum spicy', 'spicy tuna', 'spicy',
-                'salmão grelhado', 'salmao grelhado', 'grilled salmon',
-                # Pratos quentes
-                'yakissoba', 'yakisoba', 'yaki soba', 'macarrão japonês',
-                'udon', 'macarrão udon', 'sopa udon',
-                'teriyaki', 'teriyaki chicken', 'frango teriyaki',
-                # Combinados
-                'combo', 'combinado', 'combo salmão', 'combo salmao',
-                'combo misto', 'combo família', 'combo familia',
-                'combo atum', 'rodízio', 'festival',
-                # Frases completas
-                'quero salmão', 'quero atum', 'quero temaki', 'quero yakissoba',
-                'quero combo', 'quero udon', 'quero hot roll', 'quero califórnia'
-            ],
-            'itens_disponiveis': ['cardápio', 'menu', 'sabores', 'sushis', 'opções', 'tem', 'pratos', 'temakis', 'yakissoba', 'combinados'],
-            'precos': ['preço', 'preco', 'valor', 'custa', 'quanto'],
-            'tempo_entrega': ['tempo', 'entrega', 'demora', 'prazo', 'quando'],
-            'agradecimento': ['obrigado', 'obrigada', 'valeu', 'brigado', 'thanks'],
-            'reclamacao': ['problema', 'reclamação', 'ruim', 'fria', 'errada', 'atrasada'],
-            'despedida': ['tchau', 'bye', 'até logo', 'falou', 'até mais', 'adeus'],
-            'ingredientes': ['ingredientes', 'receita', 'o que tem', 'buscar ingredientes', 'preciso dos ingredientes']
-        }
+        scores = [0] * len(self.keyword_tags)
+        for termo in self.matcher.find_all(message):
+            for intent_idx in self.keyword_hits.get(termo, ()):
+                scores[intent_idx] += 1
         
         best_intent = "desconhecido"
         best_score = 0.0
         
-        for intent, words in keywords.items():
-            score = sum(1 for word in words if word in message)
+        for intent, score in zip(self.keyword_tags, scores):
             if score > best_score:
                 best_score = score
                 best_intent = intent
@@ -277,138 +352,234 @@ class RestauranteJaponesChatbotSimples:
         
         return pratos_selecionados
 
-    def get_response(self, message, selecao_prato=None, api_key=None):
+    def resposta_selecao_invalida(self):
+        """Resposta quando a seleção de pratos não corresponde a nenhum prato"""
+        return {
+            'response': "Seleção inválida. Por favor, escolha um número da lista ou digite o nome do prato.",
+            'intent': "ingredientes",
+            'probability': 100.0,
+            'all_intents': ["ingredientes"],
+            'all_probabilities': [100.0],
+            'sentences_processed': 1,
+            'needs_prato_selection': True
+        }
+
+    def resposta_receitas(self, pratos_selecionados, resultados):
+        """Monta a resposta com as receitas dos pratos selecionados"""
+        respostas_ingredientes = []
+        for prato, resultado in zip(pratos_selecionados, resultados):
+            respostas_ingredientes.append(f"🍽️ **{prato.title()}**\n\n{resultado}\n")
+        
+        return {
+            'response': "\n\n" + "="*50 + "\n\n".join(respostas_ingredientes),
+            'intent': "ingredientes",
+            'probability': 100.0,
+            'all_intents': ["ingredientes"],
+            'all_probabilities': [100.0],
+            'sentences_processed': 1,
+            'needs_prato_selection': False
+        }
+
+    def resposta_receitas_stream(self):
+        """Primeiro evento do /chat/stream na seleção: as receitas vêm depois, em pedaços"""
+        return {
+            'response': "",
+            'intent': "ingredientes",
+            'probability': 100.0,
+            'all_intents': ["ingredientes"],
+            'all_probabilities': [100.0],
+            'sentences_processed': 1,
+            'needs_prato_selection': False
+        }
+
+    def split_sentences(self, message):
+        """Divide a mensagem em frases para tratar múltiplas intenções"""
+        sentences = re.split(r'[.!?;]+|\s+e\s+|\s+,\s*(?=quero|preciso|gostaria|vou)', message)
+        sentences = [s.strip() for s in sentences if s.strip()]
+        if not sentences:
+            sentences = [message]
+        return sentences
+
+    def classificar_frases(self, sentences):
+        """Classifica as frases, localmente ou no pool de processos.
+
+        Gera tuplas (frase, intenção, score, prato). No modo local a geração é
+        preguiçosa: quem para de consumir (ver classificar_mensagem) evita
+        avaliar as frases restantes; o pool classifica todas de uma vez.
+        """
+        if self.pool is not None:
+            with metricas.span('classificar_pool'):
+                return self.pool.classificar([s for s in sentences if s], self.modelo_ativo())
+        return ((s, *self.predict_intent(s), self.extract_prato(s)) for s in sentences if s)
+
+    def classificar_mensagem(self, message):
+        """Retorna (número de frases, classificação de cada frase) da mensagem.
+
+        A classificação (frase, intenção, score, prato) fica em um cache LRU
+        por mensagem no snapshot do modelo: mensagens repetidas ("oi",
+        "obrigado") não passam de novo pela divisão e pela classificação.
+        A classificação para no primeiro pedido de ingredientes (a resposta
+        é a lista de pratos), então as frases seguintes nem são avaliadas.
+        """
+        cache = self.modelo_ativo().classificacoes
+        if cache is not None:
+            resultado = cache.get(message)
+            if resultado is not None:
+                metricas.contar('chatbot_cache_classificacao_total', resultado='hit')
+                return resultado
+            metricas.contar('chatbot_cache_classificacao_total', resultado='miss')
+        with metricas.span('dividir_frases'):
+            sentences = self.split_sentences(message)
+        classificacao = []
+        for item in self.classificar_frases(sentences):
+            classificacao.append(item)
+            if item[1] == "ingredientes":
+                break
+        resultado = (len(sentences), tuple(classificacao))
+        if cache is not None:
+            cache.put(message, resultado)
+        return resultado
+
+    def estatisticas_cache(self):
+        """Hits, misses e ocupação do cache de classificação do modelo atual (None se desativado)"""
+        cache = self.modelo_ativo().classificacoes
+        return cache.stats() if cache is not None else None
+
+    def usar_pool(self, workers=None):
+        """Passa a classificar as frases em um pool de processos"""
+        self.pool = ClassificadorPool(self, workers)
+
+    @_com_modelo_fixo
+    def get_response(self, message, selecao_prato=None, api_key=None, sessao=None):
         """Retorna resposta para a mensagem, identificando múltiplas intenções e pedidos de sabor.
         
         Args:
             message: Mensagem do usuário
             selecao_prato: Texto com seleção de prato (número ou nome) - usado quando já foi detectada intenção ingredientes
             api_key: API key do Gemini (opcional, pode vir de variável de ambiente)
+            sessao: Estado da conversa (ver sessions.py), atualizado no lugar; com ele a
+                seleção de prato pendente não precisa ser reenviada pelo cliente
         """
         # Normaliza a mensagem
         message = message.strip()
         
+        if sessao is None:
+            return self._responder(message, selecao_prato, api_key)
+        
+        # Lista de pratos já mostrada: a mensagem é a escolha do prato
+        if sessao['aguardando_selecao'] and not selecao_prato:
+            selecao_prato = message
+        result = self._responder(message, selecao_prato, api_key, sessao['cumprimentado'])
+        
+        sessao['aguardando_selecao'] = result['needs_prato_selection']
+        sessao['cumprimentado'] = sessao['cumprimentado'] or "cumprimento" in result['all_intents']
+        adicionar_ao_pedido(sessao, result.get('pratos_pedidos', []))
+        return result
+    
+    def _responder(self, message, selecao_prato=None, api_key=None, cumprimentado=False):
+        """Corpo do get_response; cumprimentado indica que a conversa já teve um cumprimento"""
         # Se temos seleção de prato e API key, processa diretamente a busca de ingredientes
         if selecao_prato and api_key:
             pratos_selecionados = self.processar_selecao_pratos(selecao_prato)
             if not pratos_selecionados:
-                return {
-                    'response': "Seleção inválida. Por favor, escolha um número da lista ou digite o nome do prato.",
-                    'intent': "ingredientes",
-                    'probability': 100.0,
-                    'all_intents': ["ingredientes"],
-                    'all_probabilities': [100.0],
-                    'sentences_processed': 1,
-                    'needs_prato_selection': True
-                }
-            
-            # Busca ingredientes para cada prato selecionado
-            respostas_ingredientes = []
-            for prato in pratos_selecionados:
-                resultado = self.consulta_gemini(prato, api_key)
-                respostas_ingredientes.append(f"🍽️ **{prato.title()}**\n\n{resultado}\n")
+                return self.resposta_selecao_invalida()
             
-            return {
-                'response': "\n\n" + "="*50 + "\n\n".join(respostas_ingredientes),
-                'intent': "ingredientes",
-                'probability': 100.0,
-                'all_intents': ["ingredientes"],
-                'all_probabilities': [100.0],
-                'sentences_processed': 1,
-                'needs_prato_selection': False
-            }
+            # Busca ingredientes de todos os pratos selecionados em paralelo
+            with metricas.span('gemini'):
+                resultados = self.gemini.consultar_varios(pratos_selecionados, api_key)
+            return self.resposta_receitas(pratos_selecionados, resultados)
         
-        # Divide a mensagem em frases se houver múltiplas
-        sentences = re.split(r'[.!?;]+|\s+e\s+|\s+,\s*(?=quero|preciso|gostaria|vou)', message)
-        sentences = [s.strip() for s in sentences if s.strip()]
-        if not sentences:
-            sentences = [message]
+        # Divide a mensagem em frases e classifica (ou reaproveita do cache)
+        total_frases, classificacao = self.classificar_mensagem(message)
 
-        responses = []
+        # Respostas pré-processadas por tag e sorteio de uma delas
+        respostas = self.modelo_ativo().respostas
+
+        def sortear(tag):
+            opcoes = respostas.get(tag)
+            return random.choice(opcoes) if opcoes is not None else None
+
+        responses = []  # (texto, palavras, total de palavras, é saudação)
+        saudacao_enviada = False
         intents_detected = []
         probabilities = []
+        pratos_pedidos = []
         sabor_confirmado = False
 
-        for sentence in sentences:
-            if sentence:
-                intent, probability = self.predict_intent(sentence)
-                intents_detected.append(intent)
-                probabilities.append(probability)
-
-                # Se detectou intenção de ingredientes, retorna lista de pratos
-                if intent == "ingredientes":
-                    lista_pratos = self.get_lista_pratos()
-                    # Verifica se tem API key na variável de ambiente
-                    api_key_env = os.getenv('GEMINI_API_KEY')
-                    mensagem_extra = ""
-                    if not api_key_env and not api_key:
-                        mensagem_extra = "\n\n⚠️ Nota: Você precisará fornecer uma API Key do Gemini ao selecionar o prato."
-                    return {
-                        'response': lista_pratos + mensagem_extra,
-                        'intent': "ingredientes",
-                        'probability': round(probability * 100, 2),
-                        'all_intents': intents_detected,
-                        'all_probabilities': [round(p * 100, 2) for p in probabilities],
-                        'sentences_processed': len(sentences),
-                        'needs_prato_selection': True
-                    }
-
-                prato = self.extract_prato(sentence)
-                
-                # Se for pedido de compra e tem prato, responde confirmando o pedido
-                if intent == "compra" and prato:
-                    responses.append(f"Pedido anotado! Seu(a) {prato.title()} está sendo preparado(a) pelo nosso sushiman. Deseja adicionar algo mais? 🍣")
-                    sabor_confirmado = True
-                    continue
+        for sentence, intent, probability, prato in classificacao:
+            intents_detected.append(intent)
+            probabilities.append(probability)
+            metricas.contar('chatbot_frases_total')
+            metricas.contar('chatbot_intencoes_total', intent=intent)
 
-                # Se for itens disponíveis, responde normalmente
-                if intent == "itens_disponiveis":
-                    for intent_data in self.intents['intents']:
-                        if intent_data['tag'] == intent:
-                            response = random.choice(intent_data['responses'])
-                            responses.append(response)
-                            break
-                    continue
+            # Se detectou intenção de ingredientes, retorna lista de pratos
+            if intent == "ingredientes":
+                lista_pratos = self.get_lista_pratos()
+                # Verifica se tem API key na variável de ambiente
+                api_key_env = os.getenv('GEMINI_API_KEY')
+                mensagem_extra = ""
+                if not api_key_env and not api_key:
+                    mensagem_extra = "\n\n⚠️ Nota: Você precisará fornecer uma API Key do Gemini ao selecionar o prato."
+                return {
+                    'response': lista_pratos + mensagem_extra,
+                    'intent': "ingredientes",
+                    'probability': round(probability * 100, 2),
+                    'all_intents': intents_detected,
+                    'all_probabilities': [round(p * 100, 2) for p in probabilities],
+                    'sentences_processed': total_frases,
+                    'needs_prato_selection': True
+                }
 
-                # Se for cumprimento, responde só uma vez por conversa
-                if intent == "cumprimento" and len([r for r in responses if "bem-vindo" in r.lower() or "konnichiwa" in r.lower()]) == 0:
-                    for intent_data in self.intents['intents']:
-                        if intent_data['tag'] == intent:
-                            response = random.choice(intent_data['responses'])
-                            responses.append(response)
-                            break
-                    continue
+            # Se for pedido de compra e tem prato, responde confirmando o pedido
+            if intent == "compra" and prato:
+                responses.append(preparar_resposta(f"Pedido anotado! Seu(a) {prato.title()} está sendo preparado(a) pelo nosso sushiman. Deseja adicionar algo mais? 🍣"))
+                pratos_pedidos.append(prato)
+                sabor_confirmado = True
+                continue
 
-                # Se for compra sem prato, responde normalmente
-                if intent == "compra" and not prato:
-                    for intent_data in self.intents['intents']:
-                        if intent_data['tag'] == intent:
-                            response = random.choice(intent_data['responses'])
-                            responses.append(response)
-                            break
-                    continue
+            # Se for cumprimento, responde só uma vez por conversa (a não ser que
+            # a mensagem seja só o cumprimento, para não ficar sem resposta)
+            if intent == "cumprimento" and cumprimentado and total_frases > 1:
+                continue
+
+            # Itens disponíveis, primeiro cumprimento e compra sem prato: resposta da
+            # própria intenção, se existir
+            if intent == "itens_disponiveis" or (intent == "cumprimento" and not saudacao_enviada) \
+                    or (intent == "compra" and not prato):
+                resposta = sortear(intent)
+                if resposta is not None:
+                    responses.append(resposta)
+                    saudacao_enviada = saudacao_enviada or resposta[3]
+                continue
 
-                # Outras intenções
-                response_found = False
-                for intent_data in self.intents['intents']:
-                    if intent_data['tag'] == intent:
-                        response = random.choice(intent_data['responses'])
-                        responses.append(response)
-                        response_found = True
+            # Outras intenções
+            resposta = sortear(intent)
+            if resposta is None:
+                resposta = preparar_resposta("Desculpe, não entendi muito bem. Pode me falar mais sobre o que você precisa?")
+            responses.append(resposta)
+            saudacao_enviada = saudacao_enviada or resposta[3]
+
+        # Remove respostas muito similares: índice palavra -> respostas já aceitas,
+        # para contar as palavras em comum sem comparar todos os pares
+        with metricas.span('deduplicar'):
+            final_responses = []
+            aceitas_por_palavra = {}
+            for texto, palavras, total, _ in responses:
+                limite = total * 0.6
+                em_comum = {}
+                similar_found = False
+                for palavra in palavras:
+                    for idx in aceitas_por_palavra.get(palavra, ()):
+                        em_comum[idx] = em_comum.get(idx, 0) + 1
+                        if em_comum[idx] > limite:
+                            similar_found = True
+                            break
+                    if similar_found:
                         break
-                if not response_found:
-                    responses.append("Desculpe, não entendi muito bem. Pode me falar mais sobre o que você precisa?")
-
-        # Remove respostas muito similares
-        final_responses = []
-        for r in responses:
-            similar_found = False
-            for existing in final_responses:
-                if len(set(r.split()) & set(existing.split())) > len(r.split()) * 0.6:
-                    similar_found = True
-                    break
-            if not similar_found:
-                final_responses.append(r)
+                if not similar_found:
+                    for palavra in palavras:
+                        aceitas_por_palavra.setdefault(palavra, []).append(len(final_responses))
+                    final_responses.append(texto)
 
         if len(final_responses) > 1:
             final_response = "\n\n".join(final_responses)
@@ -430,13 +601,55 @@ class RestauranteJaponesChatbotSimples:
             'probability': round(main_probability * 100, 2),
             'all_intents': intents_detected,
             'all_probabilities': [round(p * 100, 2) for p in probabilities],
-            'sentences_processed': len(sentences),
-            'needs_prato_selection': False
+            'sentences_processed': total_frases,
+            'needs_prato_selection': False,
+            'pratos_pedidos': pratos_pedidos
         }
 
+def payload_chat(result, session_id=None, sessao=None):
+    """Converte o resultado de get_response no JSON devolvido pelo /chat"""
+    payload = {
+        'response': result['response'],
+        'intent': result['intent'],
+        'probability': result['probability'],
+        'all_intents': result.get('all_intents', []),
+        'all_probabilities': result.get('all_probabilities', []),
+        'sentences_processed': result.get('sentences_processed', 1),
+        'multiple_sentences': result.get('sentences_processed', 1) > 1,
+        'needs_prato_selection': result.get('needs_prato_selection', False)
+    }
+    if session_id is not None:
+        payload['session_id'] = session_id
+        payload['pedido'] = sessao['pedido']
+    return payload
+
+def evento_sse(evento, dados):
+    """Formata um evento Server-Sent Events com dados em JSON"""
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
 # Instância global do chatbot
 chatbot = RestauranteJaponesChatbotSimples()
 
+# Sessões das conversas (memória ou servidor compatível com Redis, ver sessions.py)
+sessoes = session_store_from_env()
+# API keys informadas pelos clientes, por sessão, fora do estado das sessões
+chaves_api = chaves_api_from_env()
+
+def iniciar_servicos(chatbot):
+    """Pool de processos e monitor de arquivos, nesta ordem.
+
+    O fork do pool (CLASSIFY_PROCESSES=N) precisa acontecer antes de existir
+    qualquer outra thread; só depois sobe o monitor (INTENTS_WATCH=1), cujo
+    recarregamento já encontra o pool pronto.
+    """
+    if os.getenv('CLASSIFY_PROCESSES'):
+        chatbot.usar_pool(int(os.getenv('CLASSIFY_PROCESSES')))
+    if os.getenv('INTENTS_WATCH'):
+        MonitorArquivos(['intents.json', 'vocabulario.json'], chatbot.recarregar,
+                        float(os.getenv('INTENTS_WATCH_INTERVAL', '2'))).start()
+
+iniciar_servicos(chatbot)
+
 if __name__ == "__main__":
     print("Chatbot do Sakura Sushi iniciado!")
     print("Digite 'sair' para encerrar.")
@@ -0,0 +1,107 @@
+import re
+from functools import lru_cache
+
+PALAVRA = re.compile(r'\w+')
+# Fator aplicado à confiança de uma intenção só reconhecida após a correção
+DESCONTO_CORRECAO = 0.8
+
+
+def delecoes(palavra, distancia):
+    """Todas as variantes da palavra com até `distancia` letras removidas."""
+    resultado = {palavra}
+    fronteira = {palavra}
+    for _ in range(distancia):
+        proxima = set()
+        for variante in fronteira:
+            for i in range(len(variante)):
+                proxima.add(variante[:i] + variante[i + 1:])
+        resultado |= proxima
+        fronteira = proxima
+    return resultado
+
+
+def distancia_edicao(a, b, limite):
+    """Distância de Damerau-Levenshtein (transposições adjacentes) entre a e b.
+
+    Para assim que a distância certamente passa de `limite` e retorna
+    limite + 1 nesse caso.
+    """
+    if abs(len(a) - len(b)) > limite:
+        return limite + 1
+    anterior2 = None
+    anterior = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        atual = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            custo = 0 if a[i - 1] == b[j - 1] else 1
+            atual[j] = min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + custo)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                atual[j] = min(atual[j], anterior2[j - 2] + 1)
+        if min(atual) > limite:
+            return limite + 1
+        anterior2, anterior = anterior, atual
+    return anterior[-1]
+
+
+class CorretorOrtografico:
+    """Correção de erros de digitação no estilo SymSpell (índice de deleções).
+
+    Cada palavra do vocabulário é indexada por todas as suas variantes com até
+    `max_dist` letras removidas. Na consulta, as variantes da palavra digitada
+    são procuradas nesse índice e só os poucos candidatos encontrados passam
+    pela distância de edição; o custo depende do tamanho da palavra, não do
+    vocabulário. Palavras curtas aceitam 1 erro e as longas (a partir de
+    `longa` letras), 2; abaixo de `min_len` não há correção.
+    """
+
+    def __init__(self, frequencias, max_dist=2, min_len=4, longa=8, cache_size=8192):
+        self.frequencias = dict(frequencias)   # palavra -> peso no desempate
+        self.max_dist = max_dist
+        self.min_len = min_len
+        self.longa = longa
+        self._delecoes = {}                    # variante -> palavras do vocabulário
+        for palavra in self.frequencias:
+            if len(palavra) < self.min_len:
+                continue
+            for variante in delecoes(palavra, self._limite(palavra)):
+                self._delecoes.setdefault(variante, []).append(palavra)
+        self.corrigir = lru_cache(maxsize=cache_size)(self._corrigir)
+
+    def _limite(self, palavra):
+        return min(self.max_dist, 1 if len(palavra) < self.longa else 2)
+
+    def _corrigir(self, palavra):
+        """Palavra do vocabulário mais próxima, ou None se não houver (ou se já for conhecida).
+
+        Desempate: menor distância, maior frequência e ordem alfabética.
+        """
+        if palavra in self.frequencias or len(palavra) < self.min_len or not palavra.isalpha():
+            return None
+        limite = self._limite(palavra)
+        melhor = None
+        vistos = set()
+        for variante in delecoes(palavra, limite):
+            for candidata in self._delecoes.get(variante, ()):
+                if candidata in vistos:
+                    continue
+                vistos.add(candidata)
+                dist = distancia_edicao(palavra, candidata, limite)
+                if dist > limite:
+                    continue
+                chave = (dist, -self.frequencias[candidata], candidata)
+                if melhor is None or chave < melhor:
+                    melhor = chave
+        return melhor[2] if melhor else None
+
+    def corrigir_palavras(self, palavras):
+        """Lista com as palavras desconhecidas corrigidas, ou None se nada mudou."""
+        corrigidas = [self.corrigir(p) or p for p in palavras]
+        return corrigidas if corrigidas != palavras else None
+
+    def corrigir_texto(self, texto):
+        """Texto com as palavras desconhecidas corrigidas, ou None se nada mudou."""
+        corrigir = self.corrigir
+        # Caminho comum: nenhuma palavra a corrigir, sem reconstruir o texto
+        if not any(corrigir(p) for p in PALAVRA.findall(texto)):
+            return None
+        return PALAVRA.sub(lambda m: corrigir(m.group()) or m.group(), texto)
@@ -0,0 +1,579 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metricas
+from upstream_guard import STATUS_TRANSITORIOS, guarda_from_env
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta"
+GEMINI_MODEL = "gemini-pro"
+
+
+class RecipeCache:
+    """Cache LRU com expiração (TTL) para as receitas, seguro entre threads."""
+
+    def __init__(self, max_size=256, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, incluir_expiradas=False):
+        """Retorna o valor em cache ou None se ausente/expirado.
+
+        Itens expirados continuam guardados (até saírem pelo LRU) para servir
+        de receita antiga quando a API está fora (incluir_expiradas=True).
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic() and not incluir_expiradas:
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SingleFlight:
+    """Agrupa chamadas simultâneas com a mesma chave em uma única execução.
+
+    A primeira thread executa a função; as demais esperam e recebem o mesmo
+    resultado (ou a mesma exceção).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'event': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+
+class GeminiClient:
+    """Cliente da API Gemini para receitas: conexões reaproveitadas, cache e
+    consultas concorrentes.
+
+    - Uma única requests.Session com pool de conexões para todas as chamadas;
+    - Cache TTL+LRU por nome de prato, compartilhado entre as requisições;
+    - Single-flight: pedidos simultâneos do mesmo prato geram uma só chamada;
+    - consultar_varios dispara as consultas de vários pratos em paralelo;
+    - Opcionalmente, um RecipeStore persistente é lido antes da rede;
+    - Chamadas protegidas pela GuardaUpstream (limite por API key, circuit
+      breaker, retentativas e prazo); sem a API, serve a receita antiga.
+    """
+
+    def __init__(self, base_url=None, model=None, timeout=30, max_workers=8,
+                 cache_size=256, cache_ttl=3600, store=None, guarda=None, max_connections=None):
+        self.base_url = (base_url or os.getenv('GEMINI_API_URL') or GEMINI_API_URL).rstrip('/')
+        self.model = model or os.getenv('GEMINI_MODEL') or GEMINI_MODEL
+        self.timeout = timeout
+        self.cache = RecipeCache(max_size=cache_size, ttl=cache_ttl)
+        self.single_flight = SingleFlight()
+        self.store = store
+        self.guarda = guarda or guarda_from_env()
+        self.session = requests.Session()
+        # As threads das requisições também chamam a API (um prato só, sem o
+        # executor): o pool comporta todas, além das threads do executor
+        if max_connections is None:
+            max_connections = int(os.getenv('GEMINI_MAX_CONNECTIONS', '64'))
+        self.max_connections = max(max_connections, max_workers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gemini')
+
+    @staticmethod
+    def cache_key(nome_prato):
+        return nome_prato.strip().lower()
+
+    def build_payload(self, nome_prato):
+        prompt = f"Quais são os ingredientes e a receita completa do prato {nome_prato}? Forneça uma receita detalhada com todos os ingredientes e modo de preparo."
+        return {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": 0.7,
+                "maxOutputTokens": 1024
+            }
+        }
+
+    def consultar(self, nome_prato, api_key, usar_cache=True, esperar_limite=False):
+        """Retorna a receita do prato (do cache, do armazenamento ou da API).
+
+        Só respostas válidas vão para o cache; mensagens de erro são
+        devolvidas ao usuário mas não ficam guardadas. Com usar_cache=False
+        a API é sempre consultada (usado no pré-aquecimento forçado). Com
+        esperar_limite=True, o limite de taxa atrasa a chamada em vez de recusá-la.
+        """
+        key = self.cache_key(nome_prato)
+        if usar_cache:
+            cached = self.cached(key)
+            if cached is not None:
+                metricas.contar('chatbot_gemini_cache_total', resultado='hit')
+                return cached
+        metricas.contar('chatbot_gemini_cache_total', resultado='miss')
+        return self.single_flight.do(
+            key, lambda: self._consultar_api(key, nome_prato, api_key, usar_cache, esperar_limite))
+
+    def consultar_varios(self, pratos, api_key, usar_cache=True, esperar_limite=False):
+        """Consulta vários pratos em paralelo, mantendo a ordem da seleção."""
+        if len(pratos) == 1:
+            return [self.consultar(pratos[0], api_key, usar_cache, esperar_limite)]
+        return list(self.executor.map(
+            lambda prato: self.consultar(prato, api_key, usar_cache, esperar_limite), pratos))
+
+    def cached(self, key):
+        """Procura a receita no cache em memória e depois no armazenamento."""
+        cached = self.cache.get(key)
+        if cached is None and self.store is not None:
+            cached = self.store.get(key)
+            if cached is not None:
+                self.cache.set(key, cached)
+        return cached
+
+    def _consultar_api(self, key, nome_prato, api_key, usar_cache=True, esperar_limite=False):
+        # Outra thread pode ter preenchido o cache enquanto esperávamos
+        if usar_cache:
+            cached = self.cached(key)
+            if cached is not None:
+                return cached
+
+        motivo = self.guarda.admitir(api_key, esperar_limite)
+        if motivo is not None:
+            return self.resposta_recusada(key, nome_prato, motivo)
+
+        url = f"{self.base_url}/models/{self.model}:generateContent"
+        headers = {
+            "Content-Type": "application/json",
+        }
+        params = {"key": api_key}
+        try:
+            with metricas.span('gemini_api'):
+                resp = self._post(url, api_key, self.guarda.prazo(), headers=headers, params=params,
+                                  json=self.build_payload(nome_prato))
+            content, mensagem = extrair_receita(nome_prato, resp.json())
+            if content:
+                self.guardar(key, content)
+            else:
+                metricas.contar('chatbot_gemini_erros_total', tipo='sem_conteudo')
+            return mensagem
+        except requests.exceptions.Timeout as e:
+            metricas.contar('chatbot_gemini_erros_total', tipo='timeout')
+            return self.receita_antiga(key, f"Erro ao consultar a API Gemini: {str(e)}")
+        except requests.exceptions.RequestException as e:
+            metricas.contar('chatbot_gemini_erros_total', tipo='http')
+            return self.receita_antiga(key, f"Erro ao consultar a API Gemini: {str(e)}")
+        except Exception as e:
+            metricas.contar('chatbot_gemini_erros_total', tipo='inesperado')
+            return f"Erro inesperado: {str(e)}"
+
+    def _post(self, url, api_key, prazo, **kwargs):
+        """POST com retentativas nos erros transitórios, dentro do prazo.
+
+        Cada resultado é informado ao circuit breaker. Retorna a resposta de
+        sucesso ou levanta o erro da última tentativa (erros 4xx, exceto 429,
+        não são repetidos).
+        """
+        tentativa = 1
+        while True:
+            try:
+                resp = self.session.post(url, timeout=min(self.timeout, prazo.restante()), **kwargs)
+                if resp.ok:
+                    self.guarda.sucesso()
+                    return resp
+                # Resposta de erro: fecha antes de levantar, devolvendo a conexão
+                # ao pool (com stream=True o corpo ainda não foi lido)
+                with resp:
+                    try:
+                        resp.raise_for_status()
+                    except requests.exceptions.HTTPError as e:
+                        erro = e
+                if resp.status_code not in STATUS_TRANSITORIOS:
+                    self.guarda.sucesso()
+                    raise erro
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                erro = e
+            self.guarda.falha()
+            espera = self.guarda.espera(tentativa, prazo, api_key)
+            if espera is None:
+                raise erro
+            time.sleep(espera)
+            tentativa += 1
+
+    def receita_antiga(self, key, mensagem):
+        """Receita guardada, mesmo vencida, para quando a API falha; senão a mensagem de erro."""
+        receita = self.cache.get(key, incluir_expiradas=True)
+        if receita is None and self.store is not None:
+            receita = self.store.get(key, incluir_expiradas=True)
+        if receita is None:
+            return mensagem
+        metricas.contar('chatbot_gemini_guarda_total', evento='receita_antiga')
+        return f"{receita}\n\n(Receita salva anteriormente: a API Gemini não respondeu agora.)"
+
+    def resposta_recusada(self, key, nome_prato, motivo):
+        """Resposta quando a guarda recusa a chamada (limite de taxa ou circuito aberto)."""
+        if motivo == 'limite_taxa':
+            mensagem = f"Muitas consultas de receitas em pouco tempo. Tente {nome_prato} de novo em alguns segundos."
+        else:
+            mensagem = "A API Gemini está instável no momento. Tente novamente em instantes."
+        return self.receita_antiga(key, mensagem)
+
+    def guardar(self, key, content):
+        """Guarda uma receita válida no cache em memória e no armazenamento."""
+        self.cache.set(key, content)
+        if self.store is not None:
+            self.store.put(key, content)
+
+    def consultar_stream(self, nome_prato, api_key):
+        """Gera a receita em pedaços, à medida que a API os envia (SSE).
+
+        Receitas em cache saem inteiras de uma vez. A receita completa só vai
+        para o cache se o stream terminar com conteúdo; erros viram um último
+        pedaço com a mensagem, como em consultar.
+        """
+        key = self.cache_key(nome_prato)
+        cached = self.cached(key)
+        if cached is not None:
+            metricas.contar('chatbot_gemini_cache_total', resultado='hit')
+            yield cached
+            return
+        metricas.contar('chatbot_gemini_cache_total', resultado='miss')
+
+        motivo = self.guarda.admitir(api_key)
+        if motivo is not None:
+            yield self.resposta_recusada(key, nome_prato, motivo)
+            return
+
+        url = f"{self.base_url}/models/{self.model}:streamGenerateContent"
+        params = {"key": api_key, "alt": "sse"}
+        partes = []
+        try:
+            # Retentativas só até o início do stream; depois os pedaços já saíram
+            with self._post(url, api_key, self.guarda.prazo(), params=params,
+                            json=self.build_payload(nome_prato), stream=True) as resp:
+                for texto in eventos_sse(resp.iter_lines(chunk_size=None, decode_unicode=True)):
+                    partes.append(texto)
+                    yield texto
+        except requests.exceptions.Timeout as e:
+            metricas.contar('chatbot_gemini_erros_total', tipo='timeout')
+            yield f"Erro ao consultar a API Gemini: {str(e)}" if partes else \
+                self.receita_antiga(key, f"Erro ao consultar a API Gemini: {str(e)}")
+            return
+        except requests.exceptions.RequestException as e:
+            metricas.contar('chatbot_gemini_erros_total', tipo='http')
+            yield f"Erro ao consultar a API Gemini: {str(e)}" if partes else \
+                self.receita_antiga(key, f"Erro ao consultar a API Gemini: {str(e)}")
+            return
+        except Exception as e:
+            metricas.contar('chatbot_gemini_erros_total', tipo='inesperado')
+            yield f"Erro inesperado: {str(e)}"
+            return
+
+        if partes:
+            self.guardar(key, ''.join(partes))
+        else:
+            metricas.contar('chatbot_gemini_erros_total', tipo='sem_conteudo')
+            yield f"Receita de {nome_prato}:\n\nA API não retornou conteúdo válido."
+
+    def consultar_varios_stream(self, pratos, api_key):
+        """Stream de vários pratos em paralelo, intercalado por chegada.
+
+        Gera tuplas (prato, texto) com cada pedaço assim que ele chega, de
+        qualquer prato, e (prato, None) quando o prato termina.
+        """
+        fila = queue.Queue()
+
+        def transmitir(prato):
+            try:
+                for texto in self.consultar_stream(prato, api_key):
+                    fila.put((prato, texto))
+            finally:
+                fila.put((prato, None))
+
+        for prato in pratos:
+            self.executor.submit(transmitir, prato)
+        pendentes = len(pratos)
+        while pendentes:
+            prato, texto = fila.get()
+            if texto is None:
+                pendentes -= 1
+            yield prato, texto
+
+
+class AsyncGeminiClient:
+    """Versão assíncrona (httpx) do GeminiClient para o modo ASGI.
+
+    Compartilha cache e armazenamento com o cliente síncrono, então receitas
+    obtidas por qualquer um dos dois servem para ambos. O single-flight usa
+    futures do asyncio no lugar de threads.
+    """
+
+    def __init__(self, client, max_connections=None):
+        self.client = client
+        self._http = None
+        self._max_connections = max_connections or client.max_connections
+        self._em_andamento = {}
+
+    @property
+    def http(self):
+        # Criado sob demanda para ficar no event loop do servidor
+        if self._http is None:
+            limits = httpx.Limits(max_connections=self._max_connections)
+            self._http = httpx.AsyncClient(timeout=self.client.timeout, limits=limits)
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def cached(self, key):
+        cached = self.client.cache.get(key)
+        if cached is None and self.client.store is not None:
+            # SQLite é bloqueante: a leitura vai para uma thread
+            cached = await asyncio.to_thread(self.client.cached, key)
+        return cached
+
+    async def consultar(self, nome_prato, api_key):
+        key = self.client.cache_key(nome_prato)
+        cached = await self.cached(key)
+        if cached is not None:
+            metricas.contar('chatbot_gemini_cache_total', resultado='hit')
+            return cached
+        metricas.contar('chatbot_gemini_cache_total', resultado='miss')
+
+        future = self._em_andamento.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._em_andamento[key] = future
+        try:
+            resultado = await self._consultar_api(key, nome_prato, api_key)
+            future.set_result(resultado)
+            return resultado
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # evita aviso de exceção não observada
+            raise
+        finally:
+            del self._em_andamento[key]
+
+    async def consultar_varios(self, pratos, api_key):
+        """Consulta vários pratos concorrentemente, mantendo a ordem da seleção."""
+        return list(await asyncio.gather(*(self.consultar(prato, api_key) for prato in pratos)))
+
+    async def consultar_stream(self, nome_prato, api_key):
+        """Versão assíncrona de GeminiClient.consultar_stream."""
+        key = self.client.cache_key(nome_prato)
+        cached = await self.cached(key)
+        if cached is not None:
+            metricas.contar('chatbot_gemini_cache_total', resultado='hit')
+            yield cached
+            return
+        metricas.contar('chatbot_gemini_cache_total', resultado='miss')
+
+        motivo = self.client.guarda.admitir(api_key)
+        if motivo is not None:
+            yield await self.resposta_recusada(key, nome_prato, motivo)
+            return
+
+        url = f"{self.client.base_url}/models/{self.client.model}:streamGenerateContent"
+        partes = []
+        try:
+            resp = await self._post(url, api_key, self.client.guarda.prazo(), stream=True,
+                                    params={"key": api_key, "alt": "sse"},
+                                    json=self.client.build_payload(nome_prato))
+            try:
+                async for linha in resp.aiter_lines():
+                    for texto in eventos_sse((linha,)):
+                        partes.append(texto)
+                        yield texto
+            finally:
+                await resp.aclose()
+        except httpx.TimeoutException as e:
+            metricas.contar('chatbot_gemini_erros_total', tipo='timeout')
+            yield f"Erro ao consultar a API Gemini: {str(e)}" if partes else \
+                await self.receita_antiga(key, f"Erro ao consultar a API Gemini: {str(e)}")
+            return
+        except httpx.HTTPError as e:
+            metricas.contar('chatbot_gemini_erros_total', tipo='http')
+            yield f"Erro ao consultar a API Gemini: {str(e)}" if partes else \
+                await self.receita_antiga(key, f"Erro ao consultar a API Gemini: {str(e)}")
+            return
+
+        if partes:
+            if self.client.store is not None:
+                await asyncio.to_thread(self.client.guardar, key, ''.join(partes))
+            else:
+                self.client.guardar(key, ''.join(partes))
+        else:
+            metricas.contar('chatbot_gemini_erros_total', tipo='sem_conteudo')
+            yield f"Receita de {nome_prato}:\n\nA API não retornou conteúdo válido."
+
+    async def consultar_varios_stream(self, pratos, api_key):
+        """Versão assíncrona de GeminiClient.consultar_varios_stream."""
+        fila = asyncio.Queue()
+
+        async def transmitir(prato):
+            try:
+                async for texto in self.consultar_stream(prato, api_key):
+                    await fila.put((prato, texto))
+            finally:
+                await fila.put((prato, None))
+
+        tarefas = [asyncio.create_task(transmitir(prato)) for prato in pratos]
+        try:
+            pendentes = len(pratos)
+            while pendentes:
+                prato, texto = await fila.get()
+                if texto is None:
+                    pendentes -= 1
+                yield prato, texto
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+
+    async def _consultar_api(self, key, nome_prato, api_key):
+        motivo = self.client.guarda.admitir(api_key)
+        if motivo is not None:
+            return await self.resposta_recusada(key, nome_prato, motivo)
+
+        url = f"{self.client.base_url}/models/{self.client.model}:generateContent"
+        try:
+            with metricas.span('gemini_api'):
+                resp = await self._post(url, api_key, self.client.guarda.prazo(), params={"key": api_key},
+                                        json=self.client.build_payload(nome_prato))
+            content, mensagem = extrair_receita(nome_prato, resp.json())
+            if content:
+                if self.client.store is not None:
+                    await asyncio.to_thread(self.client.guardar, key, content)
+                else:
+                    self.client.guardar(key, content)
+            else:
+                metricas.contar('chatbot_gemini_erros_total', tipo='sem_conteudo')
+            return mensagem
+        except httpx.TimeoutException as e:
+            metricas.contar('chatbot_gemini_erros_total', tipo='timeout')
+            return await self.receita_antiga(key, f"Erro ao consultar a API Gemini: {str(e)}")
+        except httpx.HTTPError as e:
+            metricas.contar('chatbot_gemini_erros_total', tipo='http')
+            return await self.receita_antiga(key, f"Erro ao consultar a API Gemini: {str(e)}")
+        except Exception as e:
+            metricas.contar('chatbot_gemini_erros_total', tipo='inesperado')
+            return f"Erro inesperado: {str(e)}"
+
+    async def _post(self, url, api_key, prazo, stream=False, **kwargs):
+        """Versão assíncrona de GeminiClient._post (mesma guarda do cliente síncrono)."""
+        guarda = self.client.guarda
+        tentativa = 1
+        while True:
+            try:
+                requisicao = self.http.build_request(
+                    'POST', url, timeout=min(self.client.timeout, prazo.restante()), **kwargs)
+                resp = await self.http.send(requisicao, stream=stream)
+                if resp.status_code not in STATUS_TRANSITORIOS:
+                    guarda.sucesso()
+                    if resp.is_error:
+                        await resp.aclose()
+                    resp.raise_for_status()
+                    return resp
+                try:
+                    resp.raise_for_status()
+                except httpx.HTTPStatusError as e:
+                    erro = e
+                await resp.aclose()
+            except httpx.TransportError as e:
+                erro = e
+            guarda.falha()
+            espera = guarda.espera(tentativa, prazo, api_key)
+            if espera is None:
+                raise erro
+            await asyncio.sleep(espera)
+            tentativa += 1
+
+    async def receita_antiga(self, key, mensagem):
+        if self.client.store is not None:
+            return await asyncio.to_thread(self.client.receita_antiga, key, mensagem)
+        return self.client.receita_antiga(key, mensagem)
+
+    async def resposta_recusada(self, key, nome_prato, motivo):
+        if self.client.store is not None:
+            return await asyncio.to_thread(self.client.resposta_recusada, key, nome_prato, motivo)
+        return self.client.resposta_recusada(key, nome_prato, motivo)
+
+
+def texto_candidato(j):
+    """Texto do primeiro candidato de uma resposta (ou de um pedaço do stream)."""
+    # Ajuste conforme o formato retornado pela Gemini
+    return j.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text")
+
+
+def eventos_sse(linhas):
+    """Textos dos eventos 'data:' de um stream SSE do streamGenerateContent.
+
+    Cada evento da Gemini vem em uma única linha 'data:' com um JSON completo.
+    """
+    for linha in linhas:
+        if not linha or not linha.startswith('data:'):
+            continue
+        texto = texto_candidato(json.loads(linha[5:]))
+        if texto:
+            yield texto
+
+
+def extrair_receita(nome_prato, j):
+    """Extrai o texto da resposta do generateContent.
+
+    Retorna (receita, mensagem): receita é None quando a resposta não tem
+    conteúdo válido, e mensagem é o texto a ser mostrado ao usuário.
+    """
+    content = texto_candidato(j)
+    if not content:
+        return None, f"Receita de {nome_prato}:\n\nA API não retornou conteúdo válido. Resposta completa: {json.dumps(j, ensure_ascii=False, indent=2)}"
+    return content, content
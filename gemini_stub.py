@@ -0,0 +1,168 @@
+"""Servidor local que imita os endpoints generateContent e
+streamGenerateContent (?alt=sse) da API Gemini.
+
+Permite testar o fluxo de ingredientes sem rede e sem API key. No modo
+stream a receita sai em vários eventos SSE, com o atraso dividido entre eles:
+
+    python gemini_stub.py --port 8089 --delay 0.5
+    export GEMINI_API_URL=http://localhost:8089/v1beta
+
+Também injeta falhas, para testar a guarda da API (upstream_guard.py): uma
+fração das chamadas responde com erro (--taxa-erro, --status-erro) ou demora
+--atraso-lento segundos (--taxa-lenta):
+
+    python gemini_stub.py --taxa-erro 0.3 --taxa-lenta 0.1 --atraso-lento 15 --seed 1
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROMPT_PRATO = re.compile(r'do prato (.+?)\?')
+
+
+def pedacos_receita(prato):
+    """Receita do stub em pedaços; juntos formam o texto do generateContent."""
+    return [f"Receita de {prato} (stub): ", "arroz, ", "peixe, ", "alga."]
+
+
+def evento(texto):
+    return {"candidates": [{"content": {"parts": [{"text": texto}], "role": "model"}}]}
+
+
+class GeminiStubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 para o stream usar Transfer-Encoding: chunked, como a API real
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        rota = re.match(r'^/v1beta/models/[^/:]+:(generateContent|streamGenerateContent)', self.path)
+        if not rota:
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        prompt = payload.get('contents', [{}])[0].get('parts', [{}])[0].get('text', '')
+        match = PROMPT_PRATO.search(prompt)
+        prato = match.group(1) if match else 'desconhecido'
+
+        self.server.registrar_chamada(prato)
+        status, atraso = self.server.sortear_falha()
+        if atraso:
+            time.sleep(atraso)
+        if status:
+            self.send_error(status)
+            return
+        if rota.group(1) == 'streamGenerateContent':
+            self.responder_stream(prato)
+            return
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        body = json.dumps({
+            "candidates": [{
+                "content": {
+                    "parts": [{"text": ''.join(pedacos_receita(prato))}],
+                    "role": "model"
+                },
+                "finishReason": "STOP"
+            }]
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def responder_stream(self, prato):
+        pedacos = pedacos_receita(prato)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for texto in pedacos:
+            if self.server.delay:
+                time.sleep(self.server.delay / len(pedacos))
+            dados = f"data: {json.dumps(evento(texto))}\r\n\r\n".encode('utf-8')
+            self.wfile.write(f"{len(dados):x}\r\n".encode('ascii') + dados + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GeminiStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, delay=0.0, taxa_erro=0.0, status_erro=503,
+                 taxa_lenta=0.0, atraso_lento=0.0, seed=None):
+        super().__init__(address, GeminiStubHandler)
+        self.delay = delay
+        self.taxa_erro = taxa_erro
+        self.status_erro = status_erro
+        self.taxa_lenta = taxa_lenta
+        self.atraso_lento = atraso_lento
+        self.chamadas = []
+        self._falhas = []   # falhas programadas (status, atraso), usadas antes das sorteadas
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def registrar_chamada(self, prato):
+        with self._lock:
+            self.chamadas.append(prato)
+
+    def injetar_falhas(self, quantidade, status=None, atraso=0.0):
+        """Programa as próximas `quantidade` chamadas para falhar (status None = só atraso)."""
+        with self._lock:
+            self._falhas.extend([(status, atraso)] * quantidade)
+
+    def limpar_falhas(self):
+        with self._lock:
+            self._falhas.clear()
+            self.taxa_erro = self.taxa_lenta = 0.0
+
+    def sortear_falha(self):
+        """(status de erro ou None, atraso extra) para a chamada atual."""
+        with self._lock:
+            if self._falhas:
+                return self._falhas.pop(0)
+            status = self.status_erro if self._rng.random() < self.taxa_erro else None
+            atraso = self.atraso_lento if self._rng.random() < self.taxa_lenta else 0.0
+            return status, atraso
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+
+def start_stub_server(port=0, delay=0.0, **falhas):
+    """Sobe o stub em uma thread de fundo e retorna o servidor.
+
+    `falhas` são os parâmetros de injeção de falhas do GeminiStubServer.
+    """
+    server = GeminiStubServer(('127.0.0.1', port), delay=delay, **falhas)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--delay', type=float, default=0.0, help='latência simulada (segundos)')
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help='fração das chamadas que falham')
+    parser.add_argument('--status-erro', type=int, default=503, help='status HTTP das falhas')
+    parser.add_argument('--taxa-lenta', type=float, default=0.0, help='fração das chamadas lentas')
+    parser.add_argument('--atraso-lento', type=float, default=0.0, help='atraso extra das chamadas lentas (segundos)')
+    parser.add_argument('--seed', type=int, default=None, help='semente do sorteio das falhas')
+    args = parser.parse_args()
+
+    server = GeminiStubServer(('127.0.0.1', args.port), delay=args.delay, taxa_erro=args.taxa_erro,
+                              status_erro=args.status_erro, taxa_lenta=args.taxa_lenta,
+                              atraso_lento=args.atraso_lento, seed=args.seed)
+    print(f"Stub Gemini em {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,308 @@
+from collections import defaultdict
+
+
+class IntentIndex:
+    """Índice compilado dos padrões do intents.json.
+
+    Os padrões são pré-processados uma única vez (na inicialização ou no
+    recarregamento das intenções) e guardados como conjuntos de IDs de tokens.
+    Um índice invertido token -> padrões permite calcular o Jaccard apenas
+    contra os padrões que compartilham pelo menos um token com a mensagem.
+    """
+
+    def __init__(self, intents, preprocess):
+        self.tags = []            # tag de cada intenção, na ordem do arquivo
+        self.vocab = {}           # token -> ID inteiro
+        self.pattern_sets = []    # conjunto de IDs de tokens de cada padrão
+        self.pattern_sizes = []   # tamanho do conjunto de cada padrão
+        self.pattern_intent = []  # índice da intenção dona de cada padrão
+        postings = defaultdict(list)
+
+        for intent_idx, intent in enumerate(intents['intents']):
+            self.tags.append(intent['tag'])
+            for pattern in intent['patterns']:
+                pattern_id = len(self.pattern_sets)
+                ids = frozenset(self.vocab.setdefault(word, len(self.vocab))
+                                for word in preprocess(pattern))
+                for token_id in ids:
+                    postings[token_id].append(pattern_id)
+                self.pattern_sets.append(ids)
+                self.pattern_sizes.append(len(ids))
+                self.pattern_intent.append(intent_idx)
+
+        # Lista indexada pelo ID do token: acesso direto, sem hashing
+        self.postings = [tuple(postings[token_id]) for token_id in range(len(self.vocab))]
+        # Matriz binária token x padrão, construída sob demanda pelo modo em lote
+        self._pattern_matrix = None
+        # Postings separados por tamanho do padrão, construídos sob demanda pelo ranking
+        self._size_postings = None
+
+    @classmethod
+    def from_arrays(cls, tags, vocab, pattern_tokens, pattern_intent, postings):
+        """Reconstrói o índice a partir dos arrays do artefato binário.
+
+        pattern_tokens e postings são sequências indexáveis de sequências de
+        IDs (por exemplo, visões sobre o arquivo mapeado em memória), usadas
+        sem cópia no caso dos postings.
+        """
+        index = cls.__new__(cls)
+        index.tags = list(tags)
+        index.vocab = {token: token_id for token_id, token in enumerate(vocab)}
+        index.pattern_sets = [frozenset(pattern_tokens[i]) for i in range(len(pattern_tokens))]
+        index.pattern_sizes = [len(ids) for ids in index.pattern_sets]
+        index.pattern_intent = pattern_intent
+        index.postings = postings
+        index._pattern_matrix = None
+        index._size_postings = None
+        return index
+
+    def encode(self, words):
+        """Converte tokens em (IDs conhecidos, tamanho do conjunto original).
+
+        Tokens fora do vocabulário não intersectam nenhum padrão, mas ainda
+        contam para a união do Jaccard, por isso o tamanho é devolvido à parte.
+        """
+        unique = set(words)
+        ids = {self.vocab[word] for word in unique if word in self.vocab}
+        return ids, len(unique)
+
+    def intent_scores(self, words):
+        """Retorna a maior similaridade de Jaccard de cada intenção.
+
+        Só os padrões candidatos (que compartilham algum token com a mensagem)
+        são avaliados; os demais têm similaridade 0.0 por definição.
+        """
+        scores = [0.0] * len(self.tags)
+        ids, size = self.encode(words)
+        if not ids:
+            return scores
+
+        # Conta as interseções percorrendo apenas as listas de postings
+        intersections = defaultdict(int)
+        for token_id in ids:
+            for pattern_id in self.postings[token_id]:
+                intersections[pattern_id] += 1
+
+        pattern_sizes = self.pattern_sizes
+        pattern_intent = self.pattern_intent
+        for pattern_id, intersection in intersections.items():
+            similarity = intersection / (size + pattern_sizes[pattern_id] - intersection)
+            intent_idx = pattern_intent[pattern_id]
+            if similarity > scores[intent_idx]:
+                scores[intent_idx] = similarity
+        return scores
+
+    def size_postings(self):
+        """Postings agrupados por tamanho: token -> {tamanho do padrão: padrões}.
+
+        Permite ao ranking avaliar um grupo de tamanho por vez.
+        """
+        if self._size_postings is None:
+            size_postings = []
+            for token_id in range(len(self.vocab)):
+                groups = defaultdict(list)
+                for pattern_id in self.postings[token_id]:
+                    groups[self.pattern_sizes[pattern_id]].append(pattern_id)
+                size_postings.append({size: tuple(ids) for size, ids in groups.items()})
+            self._size_postings = size_postings
+        return self._size_postings
+
+    def ranking(self, words, k=1):
+        """As k melhores intenções (tag, score), com parada antecipada.
+
+        Para uma mensagem com m tokens (q deles no vocabulário), um padrão de
+        tamanho p tem Jaccard no máximo min(q, p) / (m + p - min(q, p)). Os
+        padrões são avaliados por grupo de tamanho, do maior limite para o
+        menor, e a busca para quando o limite do próximo grupo fica abaixo do
+        k-ésimo melhor score já encontrado. Intenções cujo score atual já
+        alcança o limite do grupo também são puladas.
+
+        O resultado é exatamente o da pontuação exaustiva: scores iguais aos
+        de intent_scores, ordenados por score e, no empate, pela ordem do
+        arquivo. Intenções com score 0 não entram na lista.
+        """
+        ids, size = self.encode(words)
+        if not ids or k <= 0:
+            return []
+        size_postings = self.size_postings()
+        token_groups = [size_postings[token_id] for token_id in ids]
+        known = len(ids)
+
+        def bound(pattern_size):
+            overlap = min(known, pattern_size)
+            return overlap / (size + pattern_size - overlap)
+
+        # Só os tamanhos que aparecem nos postings dos tokens da mensagem
+        sizes = set()
+        for groups in token_groups:
+            sizes.update(groups)
+
+        scores = {}       # intenção -> melhor score até agora
+        threshold = 0.0   # k-ésimo melhor score (0 enquanto houver menos de k)
+        pattern_intent = self.pattern_intent
+        for pattern_size in sorted(sizes, key=bound, reverse=True):
+            limit = bound(pattern_size)
+            if limit < threshold:
+                break
+            intersections = {}
+            for groups in token_groups:
+                for pattern_id in groups.get(pattern_size, ()):
+                    intersections[pattern_id] = intersections.get(pattern_id, 0) + 1
+            union_base = size + pattern_size
+            for pattern_id, intersection in intersections.items():
+                intent_idx = pattern_intent[pattern_id]
+                best = scores.get(intent_idx, 0.0)
+                if best >= limit:
+                    continue   # nada neste grupo supera o score atual da intenção
+                similarity = intersection / (union_base - intersection)
+                if similarity > best:
+                    scores[intent_idx] = similarity
+            if len(scores) >= k:
+                threshold = max(scores.values()) if k == 1 else sorted(scores.values(), reverse=True)[k - 1]
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(self.tags[intent_idx], score) for intent_idx, score in ranked]
+
+    def pattern_matrix(self):
+        """Matriz esparsa binária (vocabulário x padrões) do modo em lote."""
+        if self._pattern_matrix is None:
+            # numpy/scipy só no modo em lote: não pesam na importação do chatbot
+            import numpy as np
+            from scipy import sparse
+            cols = [pattern_id for pattern_id, ids in enumerate(self.pattern_sets) for _ in ids]
+            rows = [token_id for ids in self.pattern_sets for token_id in ids]
+            self._pattern_matrix = sparse.csr_matrix(
+                (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                shape=(len(self.vocab), len(self.pattern_sets)))
+        return self._pattern_matrix
+
+    def batch_intent_scores(self, words_list, chunk_size=4096):
+        """Versão vetorizada de intent_scores para várias mensagens de uma vez.
+
+        Para cada bloco de mensagens monta a matriz esparsa binária M
+        (mensagens x vocabulário) e calcula interseção = M·P e
+        união = |m| + |p| - interseção apenas nas entradas não nulas. O máximo
+        por intenção sai de um reduce sobre as colunas de cada intenção.
+        Retorna um array (mensagens x intenções) de float64.
+        """
+        import numpy as np
+        from scipy import sparse
+
+        pattern_matrix = self.pattern_matrix()
+        pattern_sizes = np.asarray(self.pattern_sizes, dtype=np.float64)
+        pattern_intent = np.asarray(self.pattern_intent, dtype=np.intp)
+        result = np.zeros((len(words_list), len(self.tags)), dtype=np.float64)
+
+        for offset in range(0, len(words_list), chunk_size):
+            chunk = words_list[offset:offset + chunk_size]
+            rows, cols = [], []
+            sizes = np.zeros(len(chunk), dtype=np.float64)
+            for row, words in enumerate(chunk):
+                ids, size = self.encode(words)
+                rows.extend([row] * len(ids))
+                cols.extend(ids)
+                sizes[row] = size
+            message_matrix = sparse.csr_matrix(
+                (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                shape=(len(chunk), len(self.vocab)))
+
+            # Só as entradas com interseção > 0 existem no produto esparso
+            intersection = (message_matrix @ pattern_matrix).tocoo()
+            counts = intersection.data.astype(np.float64)
+            union = sizes[intersection.row] + pattern_sizes[intersection.col] - counts
+            np.maximum.at(result[offset:offset + len(chunk)],
+                          (intersection.row, pattern_intent[intersection.col]),
+                          counts / union)
+        return result
+
+
+def _scores_exaustivos(chatbot, words, padroes):
+    """Algoritmo antigo: Jaccard de palavras contra todos os padrões de todas as intenções."""
+    esperado = []
+    for pattern_words in padroes:
+        max_similarity = 0.0
+        for pattern in pattern_words:
+            similarity = chatbot.calculate_similarity(words, pattern)
+            if similarity > max_similarity:
+                max_similarity = similarity
+        esperado.append(max_similarity)
+    return esperado
+
+
+def verificar_paridade(chatbot, mensagens=None):
+    """Compara o índice com a varredura exaustiva original em todo o corpus.
+
+    A referência reproduz o algoritmo antigo (Jaccard de palavras contra todos
+    os padrões de todas as intenções). Retorna a lista de divergências, vazia
+    quando os rankings são idênticos.
+    """
+    padroes = [[chatbot.preprocess_text(p) for p in intent['patterns']]
+               for intent in chatbot.intents['intents']]
+    if mensagens is None:
+        mensagens = [p for intent in chatbot.intents['intents'] for p in intent['patterns']]
+
+    divergencias = []
+    for mensagem in mensagens:
+        words = chatbot.preprocess_text(mensagem)
+        esperado = _scores_exaustivos(chatbot, words, padroes)
+        obtido = chatbot.index.intent_scores(words)
+        if esperado != obtido:
+            divergencias.append((mensagem, esperado, obtido))
+    return divergencias
+
+
+def verificar_paridade_ranking(chatbot, mensagens=None, ks=(1, 3, 5)):
+    """Compara o ranking com parada antecipada com a varredura exaustiva.
+
+    Além dos padrões, usa pares de padrões concatenados (mensagens mais
+    longas, sem match perfeito) para exercitar os limites por tamanho.
+    """
+    padroes = [[chatbot.preprocess_text(p) for p in intent['patterns']]
+               for intent in chatbot.intents['intents']]
+    if mensagens is None:
+        mensagens = [p for intent in chatbot.intents['intents'] for p in intent['patterns']]
+        mensagens += [f"{a} {b}" for a, b in zip(mensagens[::7], mensagens[3::7])]
+
+    index = chatbot.index
+    divergencias = []
+    for mensagem in mensagens:
+        words = chatbot.preprocess_text(mensagem)
+        scores = _scores_exaustivos(chatbot, words, padroes)
+        ordem = sorted((i for i, score in enumerate(scores) if score > 0), key=lambda i: (-scores[i], i))
+        for k in ks:
+            esperado = [(index.tags[i], scores[i]) for i in ordem[:k]]
+            obtido = index.ranking(words, k)
+            if esperado != obtido:
+                divergencias.append((mensagem, esperado, obtido))
+                break
+    return divergencias
+
+
+def verificar_paridade_lote(chatbot, mensagens=None):
+    """Compara predict_intents_batch com o caminho de uma mensagem por vez."""
+    if mensagens is None:
+        mensagens = [p for intent in chatbot.intents['intents'] for p in intent['patterns']]
+
+    lote = chatbot.predict_intents_batch(mensagens)
+    divergencias = []
+    for mensagem, obtido in zip(mensagens, lote):
+        esperado = [chatbot.predict_intent(s) for s in chatbot.split_sentences(mensagem)]
+        if esperado != obtido:
+            divergencias.append((mensagem, esperado, obtido))
+    return divergencias
+
+
+if __name__ == "__main__":
+    from chatbot import chatbot
+
+    total = sum(len(intent['patterns']) for intent in chatbot.intents['intents'])
+    falhou = False
+    for nome, verificacao in (("índice", verificar_paridade), ("ranking", verificar_paridade_ranking),
+                              ("lote", verificar_paridade_lote)):
+        divergencias = verificacao(chatbot)
+        print(f"[{nome}] Padrões verificados: {total}")
+        print(f"[{nome}] Divergências: {len(divergencias)}")
+        for mensagem, esperado, obtido in divergencias[:20]:
+            print(f"- {mensagem!r}: esperado={esperado} obtido={obtido}")
+        falhou = falhou or bool(divergencias)
+    raise SystemExit(1 if falhou else 0)
@@ -0,0 +1,381 @@
+"""Gerador de carga e relatório de capacidade para o /chat (Flask, WSGI ou ASGI).
+
+Simula clientes com uma mistura realista de conversas: cumprimentos, frases
+com várias intenções, pedidos em vários passos (com session_id), o fluxo de
+ingredientes em dois passos (lista de pratos -> seleção, com a Gemini no
+stub local) e consultas ao /intents. Dois modos de carga:
+
+- concorrência fixa (laço fechado): N clientes, cada um começa a próxima
+  conversa quando a anterior termina;
+- taxa de chegada (laço aberto): conversas novas chegam a R por segundo
+  (Poisson), mesmo que o servidor esteja atrasado, como tráfego real.
+
+Com vários níveis (--concurrency 1 2 4 8 ... ou --rate 10 20 40 ...) o
+resultado é a curva vazão x latência, com o ponto de saturação e a vazão
+por worker e por núcleo:
+
+    python app.py                                   # Flask (porta 5000)
+    python loadtest.py --url http://127.0.0.1:5000 --concurrency 32 --duration 10
+    python loadtest.py --concurrency 1 2 4 8 16 32 64 --duration 10 --out curva.json
+    python loadtest.py --rate 20 50 100 200 --duration 10
+
+O próprio gerador pode subir o servidor (e o stub da Gemini) para cada
+execução ser reproduzível:
+
+    python loadtest.py --servidor "python app.py" --concurrency 1 4 16 64
+    python loadtest.py --servidor "gunicorn -w 4 -b 127.0.0.1:5000 app:app" --workers 4 --concurrency 4 16 64
+    python loadtest.py --servidor "uvicorn asgi:app --port 5000 --workers 4" --workers 4 --rate 100 200 400
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+
+import httpx
+
+
+CUMPRIMENTOS = ["Olá", "Oi, tudo bem?", "Bom dia!", "Boa noite", "Konnichiwa"]
+
+MULTIPLAS = [
+    "Olá! Quero fazer um pedido. Gostaria de saber o preço do combo família.",
+    "Boa noite, quero sushi de atum e também gostaria de saber o tempo de entrega.",
+    "Oi, preciso fazer um pedido urgente, quero combo salmão, quanto custa e em quanto tempo chega?",
+    "Bom dia! Quero ver o cardápio, principalmente os preços dos temakis, e também saber sobre tempo de entrega.",
+    "Meu pedido chegou frio. Quero falar com alguém e também saber o horário de funcionamento.",
+]
+
+PEDIDOS = [
+    "Quero hot roll", "Vou querer um temaki de salmão", "Quero yakissoba de frango",
+    "Gostaria de um combo família", "Quero sashimi", "Vou querer gyoza", "Quero udon",
+    "Muito obrigado", "Quanto tempo demora a entrega?", "Tchau",
+]
+
+INGREDIENTES = [
+    "Quais os ingredientes do temaki?", "Quero saber a receita", "Preciso dos ingredientes",
+    "Qual a receita do yakissoba?",
+]
+
+# Pesos padrão da mistura de conversas
+MISTURA = {'cumprimento': 3, 'multiplas': 3, 'pedido': 2, 'ingredientes': 1, 'intents': 1}
+
+TOTAL_PRATOS = 18  # pratos numerados na lista do fluxo de ingredientes
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    idx = min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))
+    return valores[idx]
+
+
+class Coletor:
+    """Latências por etapa, status HTTP e conversas concluídas de uma execução."""
+
+    def __init__(self, base_url, api_key):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.latencias = defaultdict(list)   # etapa -> segundos (só respostas 200/304)
+        self.status = Counter()
+        self.conversas = Counter()
+        self.avisos = Counter()              # ex: sessão perdida (workers sem Redis)
+        self.ativo = True                    # desligado no aquecimento
+
+    async def requisicao(self, client, etapa, metodo, caminho, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            resp = await client.request(metodo, self.base_url + caminho, **kwargs)
+        except httpx.HTTPError as e:
+            if self.ativo:
+                self.status[type(e).__name__] += 1
+            return None
+        if self.ativo:
+            self.status[resp.status_code] += 1
+            if resp.status_code in (200, 304):
+                self.latencias[etapa].append(time.perf_counter() - inicio)
+        return resp if resp.status_code == 200 else None
+
+    async def chat(self, client, etapa, payload):
+        resp = await self.requisicao(client, etapa, 'POST', '/chat', json=payload)
+        return resp.json() if resp is not None else None
+
+
+async def cenario_cumprimento(coletor, client, rng):
+    await coletor.chat(client, 'chat', {'message': rng.choice(CUMPRIMENTOS)})
+
+
+async def cenario_multiplas(coletor, client, rng):
+    await coletor.chat(client, 'chat', {'message': rng.choice(MULTIPLAS)})
+
+
+async def cenario_pedido(coletor, client, rng):
+    """Cumprimento e dois passos do pedido na mesma sessão."""
+    resposta = await coletor.chat(client, 'chat', {'message': rng.choice(CUMPRIMENTOS)})
+    session_id = resposta and resposta.get('session_id')
+    for mensagem in rng.sample(PEDIDOS, 2):
+        resposta = await coletor.chat(client, 'chat', {'message': mensagem, 'session_id': session_id})
+        if resposta and session_id and resposta.get('session_id') != session_id and coletor.ativo:
+            coletor.avisos['sessao_perdida'] += 1
+        session_id = (resposta and resposta.get('session_id')) or session_id
+
+
+async def cenario_ingredientes(coletor, client, rng):
+    """Pedido de ingredientes (lista de pratos) e a seleção na mesma sessão."""
+    resposta = await coletor.chat(client, 'chat_ingredientes',
+                                  {'message': rng.choice(INGREDIENTES), 'api_key': coletor.api_key})
+    if not resposta or not resposta.get('needs_prato_selection'):
+        return
+    pratos = rng.sample(range(1, TOTAL_PRATOS + 1), rng.randint(1, 3))
+    selecao = await coletor.chat(client, 'chat_selecao', {'message': ','.join(map(str, pratos)),
+                                                          'session_id': resposta.get('session_id')})
+    # Seleção tratada como mensagem comum: a sessão não estava neste worker
+    if selecao and selecao.get('intent') != 'ingredientes' and coletor.ativo:
+        coletor.avisos['sessao_perdida'] += 1
+
+
+async def cenario_intents(coletor, client, rng):
+    await coletor.requisicao(client, 'intents', 'GET', '/intents')
+
+
+CENARIOS = {
+    'cumprimento': cenario_cumprimento,
+    'multiplas': cenario_multiplas,
+    'pedido': cenario_pedido,
+    'ingredientes': cenario_ingredientes,
+    'intents': cenario_intents,
+}
+
+
+async def conversa(coletor, client, rng, mistura):
+    nome = rng.choices(list(mistura), weights=list(mistura.values()))[0]
+    await CENARIOS[nome](coletor, client, rng)
+    if coletor.ativo:
+        coletor.conversas[nome] += 1
+
+
+async def laco_fechado(coletor, client, mistura, concorrencia, fim, seed):
+    async def cliente(i):
+        rng = random.Random(seed * 100003 + i)
+        while time.perf_counter() < fim:
+            await conversa(coletor, client, rng, mistura)
+
+    await asyncio.gather(*(cliente(i) for i in range(concorrencia)))
+
+
+async def laco_aberto(coletor, client, mistura, taxa, fim, seed, max_em_voo):
+    """Chegadas de Poisson a `taxa` conversas/s; acima de max_em_voo, descarta."""
+    rng = random.Random(seed)
+    em_voo = set()
+    proxima = time.perf_counter()
+    while True:
+        proxima += rng.expovariate(taxa)
+        if proxima >= fim:
+            break
+        await asyncio.sleep(max(0.0, proxima - time.perf_counter()))
+        if len(em_voo) >= max_em_voo:
+            coletor.status['descartada'] += 1
+            continue
+        tarefa = asyncio.create_task(conversa(coletor, client, random.Random(rng.random()), mistura))
+        em_voo.add(tarefa)
+        tarefa.add_done_callback(em_voo.discard)
+    if em_voo:
+        await asyncio.gather(*em_voo)
+
+
+async def executar(base_url, concurrency=None, duration=10.0, timeout=60, rate=None, mistura=None,
+                   api_key='stub', aquecimento=0.0, seed=0, max_em_voo=1000):
+    """Mede um ponto da curva: concorrência fixa ou taxa de chegada (rate)."""
+    mistura = mistura or MISTURA
+    coletor = Coletor(base_url, api_key)
+    conexoes = concurrency if rate is None else max_em_voo
+    limits = httpx.Limits(max_connections=conexoes, max_keepalive_connections=conexoes)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        if aquecimento:
+            coletor.ativo = False
+            await laco_fechado(coletor, client, mistura, concurrency or 4,
+                               time.perf_counter() + aquecimento, seed + 1)
+            coletor.ativo = True
+        inicio = time.perf_counter()
+        fim = inicio + duration
+        if rate is None:
+            await laco_fechado(coletor, client, mistura, concurrency, fim, seed)
+        else:
+            await laco_aberto(coletor, client, mistura, rate, fim, seed, max_em_voo)
+        decorrido = time.perf_counter() - inicio
+
+    todas = [s for valores in coletor.latencias.values() for s in valores]
+    etapas = {}
+    for etapa, valores in sorted(coletor.latencias.items()):
+        etapas[etapa] = {
+            'requests': len(valores),
+            'p50_ms': round(percentil(valores, 50) * 1000, 1),
+            'p99_ms': round(percentil(valores, 99) * 1000, 1),
+        }
+    erros = sum(v for k, v in coletor.status.items() if k not in (200, 304))
+    return {
+        'url': base_url,
+        'modo': 'concorrencia' if rate is None else 'taxa',
+        'concurrency': concurrency,
+        'rate': rate,
+        'duration_s': round(decorrido, 2),
+        'requests': sum(coletor.status.values()),
+        'throughput_rps': round(len(todas) / decorrido, 1),
+        'conversas_s': round(sum(coletor.conversas.values()) / decorrido, 1),
+        'p50_ms': round(percentil(todas, 50) * 1000, 1),
+        'p95_ms': round(percentil(todas, 95) * 1000, 1),
+        'p99_ms': round(percentil(todas, 99) * 1000, 1),
+        'erros': erros,
+        'status': {str(k): v for k, v in coletor.status.items()},
+        'conversas': dict(coletor.conversas),
+        'avisos': dict(coletor.avisos),
+        'etapas': etapas,
+    }
+
+
+def saturacao(pontos, workers, nucleos, slo_ms, margem=0.95):
+    """Ponto de saturação da curva e a vazão por worker e por núcleo.
+
+    Saturação: o primeiro nível que já atinge `margem` da maior vazão
+    observada; dali em diante mais carga só aumenta a latência. Capacidade no
+    SLO: a maior vazão com p99 <= slo_ms e sem erros.
+    """
+    maior = max(p['throughput_rps'] for p in pontos)
+    saturado = next(p for p in pontos if p['throughput_rps'] >= margem * maior)
+    dentro_slo = [p for p in pontos if p['p99_ms'] <= slo_ms and not p['erros']]
+    capacidade = max(dentro_slo, key=lambda p: p['throughput_rps']) if dentro_slo else None
+    nivel = 'concurrency' if saturado['modo'] == 'concorrencia' else 'rate'
+
+    def resumo(p):
+        if p is None:
+            return None
+        return {
+            nivel: p[nivel],
+            'throughput_rps': p['throughput_rps'],
+            'p99_ms': p['p99_ms'],
+            'rps_por_worker': round(p['throughput_rps'] / workers, 1),
+            'rps_por_nucleo': round(p['throughput_rps'] / nucleos, 1),
+        }
+
+    return {
+        'workers': workers,
+        'nucleos': nucleos,
+        'slo_p99_ms': slo_ms,
+        'saturacao': resumo(saturado),
+        'capacidade_slo': resumo(capacidade),
+    }
+
+
+def imprimir_curva(pontos, capacidade):
+    nivel = 'concurrency' if pontos[0]['modo'] == 'concorrencia' else 'rate'
+    print(f"{nivel:>11} {'req/s':>9} {'conv/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erros':>6}",
+          file=sys.stderr)
+    for p in pontos:
+        print(f"{p[nivel]:>11} {p['throughput_rps']:>9.1f} {p['conversas_s']:>8.1f} {p['p50_ms']:>8.1f} "
+              f"{p['p95_ms']:>8.1f} {p['p99_ms']:>8.1f} {p['erros']:>6}", file=sys.stderr)
+    for nome in ('saturacao', 'capacidade_slo'):
+        r = capacidade[nome]
+        if r is None:
+            print(f"{nome}: nenhum ponto com p99 <= {capacidade['slo_p99_ms']} ms sem erros", file=sys.stderr)
+            continue
+        print(f"{nome}: {nivel}={r[nivel]}  {r['throughput_rps']} req/s  p99 {r['p99_ms']} ms  "
+              f"({r['rps_por_worker']} req/s por worker, {r['rps_por_nucleo']} por núcleo)", file=sys.stderr)
+
+
+def subir_servidor(comando, base_url, env, espera=60):
+    """Inicia o servidor e espera o /intents responder."""
+    processo = subprocess.Popen(shlex.split(comando), env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"Servidor terminou com código {processo.returncode}: {comando}")
+        try:
+            if httpx.get(base_url.rstrip('/') + '/intents', timeout=2).status_code == 200:
+                return processo
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    processo.terminate()
+    raise RuntimeError(f"Servidor não respondeu em {espera}s: {comando}")
+
+
+def ler_mistura(texto):
+    """'cumprimento=3,pedido=2,...' -> {cenário: peso}"""
+    mistura = {}
+    for item in texto.split(','):
+        nome, _, peso = item.partition('=')
+        if nome.strip() not in CENARIOS:
+            raise argparse.ArgumentTypeError(f"Cenário desconhecido: {nome} (use {', '.join(CENARIOS)})")
+        mistura[nome.strip()] = float(peso or 1)
+    return mistura
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[16],
+                        help='clientes simultâneos (vários valores = curva)')
+    parser.add_argument('--rate', type=float, nargs='+',
+                        help='conversas novas por segundo, em laço aberto (vários valores = curva)')
+    parser.add_argument('--duration', type=float, default=10.0, help='segundos por ponto')
+    parser.add_argument('--aquecimento', type=float, default=2.0, help='segundos descartados antes de cada ponto')
+    parser.add_argument('--mistura', type=ler_mistura, default=MISTURA,
+                        help='pesos dos cenários, ex: cumprimento=3,multiplas=3,pedido=2,ingredientes=1,intents=1')
+    parser.add_argument('--api-key', default='stub', help='API key enviada no fluxo de ingredientes')
+    parser.add_argument('--max-em-voo', type=int, default=1000, help='conversas simultâneas no modo --rate')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1, help='workers do servidor (para a vazão por worker)')
+    parser.add_argument('--nucleos', type=int, default=os.cpu_count(), help='núcleos do servidor')
+    parser.add_argument('--slo-ms', type=float, default=500.0, help='p99 máximo aceito na capacidade')
+    parser.add_argument('--servidor', help='comando que sobe o servidor em --url (com o stub da Gemini)')
+    parser.add_argument('--stub-delay', type=float, default=0.3, help='latência do stub da Gemini (segundos)')
+    parser.add_argument('--out', help='arquivo JSON com a curva (padrão: stdout)')
+    args = parser.parse_args()
+
+    processo = stub = None
+    if args.servidor:
+        from gemini_stub import start_stub_server
+
+        stub = start_stub_server(delay=args.stub_delay)
+        env = dict(os.environ, GEMINI_API_URL=stub.base_url, RECIPE_STORE_PATH='')
+        processo = subir_servidor(args.servidor, args.url, env)
+
+    try:
+        niveis = [('rate', r) for r in args.rate] if args.rate else [('concurrency', c) for c in args.concurrency]
+        pontos = []
+        for nome, valor in niveis:
+            opcoes = {nome: valor}
+            if nome == 'rate':
+                opcoes['concurrency'] = None
+            pontos.append(asyncio.run(executar(
+                args.url, duration=args.duration, mistura=args.mistura, api_key=args.api_key,
+                aquecimento=args.aquecimento, seed=args.seed, max_em_voo=args.max_em_voo, **opcoes)))
+    finally:
+        if processo is not None:
+            processo.terminate()
+            processo.wait()
+        if stub is not None:
+            stub.shutdown()
+
+    if len(pontos) == 1:
+        resultado = pontos[0]
+    else:
+        capacidade = saturacao(pontos, args.workers, args.nucleos, args.slo_ms)
+        imprimir_curva(pontos, capacidade)
+        resultado = {
+            'servidor': args.servidor or args.url,
+            'mistura': args.mistura,
+            'pontos': pontos,
+            'capacidade': capacidade,
+        }
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    else:
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
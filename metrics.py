@@ -0,0 +1,182 @@
+"""Métricas de latência por etapa e contadores do chatbot.
+
+Cada etapa do get_response (divisão em frases, pontuação das intenções,
+fallback por palavras-chave, extração do prato, deduplicação das respostas,
+consulta à Gemini) é medida com um span; as durações vão para histogramas e
+os eventos (intenções detectadas, uso do fallback, cache e erros da Gemini)
+para contadores. O /metrics exporta tudo no formato texto do Prometheus.
+
+Com METRICS=0 os spans viram um objeto nulo compartilhado e os contadores
+retornam na primeira linha, então o custo é desprezível. Os valores são por
+processo: com CLASSIFY_PROCESSES a classificação roda nos workers e só o
+tempo total do pool (etapa classificar_pool) é registrado.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+           0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+AJUDA = {
+    'chatbot_etapa_segundos': ('histogram', 'Duração de cada etapa do processamento'),
+    'chatbot_frases_total': ('counter', 'Frases classificadas'),
+    'chatbot_intencoes_total': ('counter', 'Frases classificadas por intenção'),
+    'chatbot_fallback_total': ('counter', 'Frases que caíram no fallback por palavras-chave'),
+    'chatbot_correcao_total': ('counter', 'Frases resolvidas pela correção de erros de digitação por etapa'),
+    'chatbot_cache_classificacao_total': ('counter', 'Mensagens por resultado do cache de classificação'),
+    'chatbot_gemini_cache_total': ('counter', 'Consultas de receitas por resultado do cache'),
+    'chatbot_gemini_erros_total': ('counter', 'Erros nas chamadas à API Gemini por tipo'),
+    'chatbot_gemini_guarda_total': ('counter', 'Eventos da guarda da API Gemini (limite, circuito, retentativas, receita antiga)'),
+    'chatbot_gemini_circuito_total': ('counter', 'Mudanças de estado do circuit breaker da API Gemini'),
+}
+
+
+class _SpanNulo:
+    """Span usado quando nada está sendo medido."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULO = _SpanNulo()
+
+
+class _Span:
+    __slots__ = ('metricas', 'etapa', 'inicio')
+
+    def __init__(self, metricas, etapa):
+        self.metricas = metricas
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metricas._registrar_span(self.etapa, time.perf_counter() - self.inicio)
+        return False
+
+
+class _Local(threading.local):
+    # Tempos da requisição em modo de depuração (ver coletar_tempos)
+    tempos = None
+
+
+class Metricas:
+    """Registro de contadores e histogramas, seguro entre threads."""
+
+    def __init__(self, habilitado=True):
+        self.habilitado = habilitado
+        self._lock = threading.Lock()
+        self._contadores = {}    # (nome, labels) -> valor
+        self._histogramas = {}   # (nome, labels) -> [contagens por bucket..., +Inf, soma, total]
+        self._local = _Local()
+        self._chaves_etapa = {}  # etapa -> chave do histograma, sem montar labels a cada span
+
+    def span(self, etapa):
+        """Context manager que mede a duração de uma etapa."""
+        if not self.habilitado and self._local.tempos is None:
+            return _NULO
+        return _Span(self, etapa)
+
+    def _registrar_span(self, etapa, segundos):
+        tempos = self._local.tempos
+        if tempos is not None:
+            tempos[etapa] = round(tempos.get(etapa, 0.0) + segundos * 1000, 3)
+        if self.habilitado:
+            chave = self._chaves_etapa.get(etapa)
+            if chave is None:
+                chave = self._chaves_etapa[etapa] = ('chatbot_etapa_segundos', (('etapa', etapa),))
+            self._observar(chave, segundos)
+
+    def contar(self, nome, valor=1, **labels):
+        if not self.habilitado:
+            return
+        chave = (nome, tuple(sorted(labels.items())) if labels else ())
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, segundos, **labels):
+        if not self.habilitado:
+            return
+        self._observar((nome, tuple(sorted(labels.items()))), segundos)
+
+    def _observar(self, chave, segundos):
+        # Índice do primeiro bucket com limite >= segundos (len(BUCKETS) = só +Inf)
+        bucket = bisect_left(BUCKETS, segundos)
+        with self._lock:
+            hist = self._histogramas.get(chave)
+            if hist is None:
+                hist = self._histogramas[chave] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+            hist[bucket] += 1
+            hist[-2] += segundos
+            hist[-1] += 1
+
+    @contextmanager
+    def coletar_tempos(self, ativo=True):
+        """Coleta as durações (ms) das etapas executadas nesta thread.
+
+        Usado no payload de depuração do /chat; produz None se inativo.
+        """
+        if not ativo:
+            yield None
+            return
+        anterior = self._local.tempos
+        self._local.tempos = tempos = {}
+        try:
+            yield tempos
+        finally:
+            self._local.tempos = anterior
+
+    def limpar(self):
+        with self._lock:
+            self._contadores.clear()
+            self._histogramas.clear()
+
+    def exportar(self):
+        """Métricas no formato texto do Prometheus (versão 0.0.4)."""
+        with self._lock:
+            contadores = dict(self._contadores)
+            histogramas = {k: list(v) for k, v in self._histogramas.items()}
+
+        linhas = []
+        nomes = sorted({nome for nome, _ in contadores} | {nome for nome, _ in histogramas})
+        for nome in nomes:
+            tipo, ajuda = AJUDA.get(nome, ('untyped', nome))
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            for (n, labels), valor in sorted(contadores.items()):
+                if n == nome:
+                    linhas.append(f"{nome}{_labels(labels)} {valor}")
+            for (n, labels), hist in sorted(histogramas.items()):
+                if n != nome:
+                    continue
+                acumulado = 0
+                for limite, contagem in zip(BUCKETS, hist):
+                    acumulado += contagem
+                    linhas.append(f"{nome}_bucket{_labels(labels + (('le', repr(limite)),))} {acumulado}")
+                linhas.append(f"{nome}_bucket{_labels(labels + (('le', '+Inf'),))} {hist[-1]}")
+                linhas.append(f"{nome}_sum{_labels(labels)} {hist[-2]}")
+                linhas.append(f"{nome}_count{_labels(labels)} {hist[-1]}")
+        return "\n".join(linhas) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pares = ','.join(f'{k}="{_escapar(v)}"' for k, v in labels)
+    return '{' + pares + '}'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Registro global do processo (METRICS=0 desativa)
+metricas = Metricas(habilitado=os.getenv('METRICS', '1').lower() not in ('0', 'false', 'nao', 'não'))
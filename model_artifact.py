@@ -0,0 +1,272 @@
+"""Artefato binário compilado a partir do intents.json e do vocabulario.json.
+
+O build tokeniza os padrões uma única vez e grava tudo que o
+chatbot precisa em um arquivo versionado, lido via mmap na inicialização:
+
+- vocabulário de tokens (o ID de cada token é sua posição);
+- tokens de cada padrão e postings token -> padrões em arrays uint32 (CSR);
+- tabelas de respostas por intenção, apelidos de pratos e palavras-chave;
+- stop words já combinadas, para não tocar no NLTK em produção;
+- nome do tokenizador usado no build (ver tokenizer.py).
+
+O cabeçalho guarda o SHA-256 dos arquivos de origem: se eles mudarem depois
+do build, o artefato é considerado desatualizado. O mesmo vale se o
+tokenizador configurado (TOKENIZER) for outro que não o do build.
+
+    python model_artifact.py build          # gera modelo.bin
+    python model_artifact.py info           # mostra versão, checksum e seções
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b'SKRM'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHHI32s')   # magic, versão, nº de seções, reservado, sha256
+ENTRY = struct.Struct('<4sQQ')        # nome da seção, offset, tamanho
+SOURCES = ('intents.json', 'vocabulario.json')
+
+
+class ArtefatoInvalidoError(ValueError):
+    """O arquivo não é um artefato válido desta versão."""
+
+
+def checksum_fontes(base_dir='.'):
+    """SHA-256 dos arquivos de origem, ou None se algum não existir."""
+    sha = hashlib.sha256()
+    for nome in SOURCES:
+        path = os.path.join(base_dir, nome)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            sha.update(f.read())
+    return sha.digest()
+
+
+def _u32(values):
+    arr = array('I', values)
+    if sys.byteorder != 'little':
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _strings(values):
+    """Lista de strings: contagem, offsets (contagem + 1) e blob UTF-8."""
+    encoded = [v.encode('utf-8') for v in values]
+    offsets = [0]
+    for item in encoded:
+        offsets.append(offsets[-1] + len(item))
+    return _u32([len(encoded)]) + _u32(offsets) + b''.join(encoded)
+
+
+def _csr(groups):
+    """Listas de inteiros em formato CSR: offsets (n + 1) seguidos dos valores."""
+    offsets = [0]
+    for group in groups:
+        offsets.append(offsets[-1] + len(group))
+    return _u32([len(groups)]) + _u32(offsets) + _u32([v for group in groups for v in group])
+
+
+def compilar(chatbot, out_path='modelo.bin', base_dir='.', modelo=None):
+    """Compila o modelo já carregado do JSON em um artefato binário.
+
+    Por padrão compila o snapshot ativo com o intents.json do disco; com
+    `modelo`, compila esse snapshot e as intenções dele (usado pelo pool de
+    processos no recarregamento).
+    """
+    if modelo is None:
+        modelo = chatbot.modelo_ativo()
+        with open(os.path.join(base_dir, 'intents.json'), 'rb') as f:
+            intents_json = f.read()
+    else:
+        intents_json = json.dumps(modelo.intents, ensure_ascii=False).encode('utf-8')
+    index = modelo.index
+    vocab = sorted(index.vocab, key=index.vocab.__getitem__)
+    keywords = modelo.vocabulario['palavras_chave']
+
+    sections = {
+        b'VOCB': _strings(vocab),
+        b'STOP': _strings(sorted(chatbot.stop_words)),
+        b'TAGS': _strings(index.tags),
+        b'PTOK': _csr([sorted(ids) for ids in index.pattern_sets]),
+        b'PINT': _u32(index.pattern_intent),
+        b'POST': _csr(index.postings),
+        b'RESP': _strings([r for intent in modelo.intents['intents'] for r in intent['responses']]),
+        b'RCNT': _u32([len(intent['responses']) for intent in modelo.intents['intents']]),
+        b'PRAT': _strings(modelo.vocabulario['pratos']),
+        b'KTAG': _strings(list(keywords)),
+        b'KWDS': _strings([w for words in keywords.values() for w in words]),
+        b'KCNT': _u32([len(words) for words in keywords.values()]),
+        b'JSON': intents_json,
+        b'TOKN': chatbot.tokenizador.nome.encode('ascii'),
+    }
+
+    checksum = checksum_fontes(base_dir) or bytes(32)
+    offset = HEADER.size + ENTRY.size * len(sections)
+    entries, blobs = [], []
+    for name, blob in sections.items():
+        padding = (-offset) % 8   # seções alinhadas em 8 bytes
+        blobs.append(bytes(padding) + blob)
+        offset += padding
+        entries.append(ENTRY.pack(name, offset, len(blob)))
+        offset += len(blob)
+
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(sections), 0, checksum))
+        f.writelines(entries)
+        f.writelines(blobs)
+    os.replace(tmp_path, out_path)   # troca atômica para leitores concorrentes
+    return out_path
+
+
+class CSR:
+    """Visão somente leitura de listas de inteiros em formato CSR."""
+
+    def __init__(self, mv):
+        count = mv[:4].cast('I')[0]
+        self.offsets = mv[4:4 + 4 * (count + 1)].cast('I')
+        self.values = mv[4 + 4 * (count + 1):].cast('I')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+
+def _read_strings(mv):
+    count = mv[:4].cast('I')[0]
+    offsets = mv[4:4 + 4 * (count + 1)].cast('I')
+    blob = mv[4 + 4 * (count + 1):]
+    return [str(blob[offsets[i]:offsets[i + 1]], 'utf-8') for i in range(count)]
+
+
+class ModelArtifact:
+    """Artefato aberto via mmap; as seções são lidas sob demanda."""
+
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise ArtefatoInvalidoError('Artefato gravado em little-endian')
+        self.path = path
+        # Arquivo vazio não pode ser mapeado (ValueError do mmap): trata antes
+        if os.path.getsize(path) < HEADER.size:
+            raise ArtefatoInvalidoError(f'{path}: arquivo truncado')
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mv = memoryview(self._mmap)
+        magic, version, count, _, self.checksum = HEADER.unpack_from(mv)
+        if magic != MAGIC:
+            raise ArtefatoInvalidoError(f'{path}: não é um artefato do chatbot')
+        if version != FORMAT_VERSION:
+            raise ArtefatoInvalidoError(f'{path}: versão {version}, esperada {FORMAT_VERSION}')
+        self.version = version
+        self.sections = {}
+        if HEADER.size + count * ENTRY.size > len(mv):
+            raise ArtefatoInvalidoError(f'{path}: arquivo truncado')
+        for i in range(count):
+            name, offset, length = ENTRY.unpack_from(mv, HEADER.size + i * ENTRY.size)
+            # Seção fora do arquivo: rejeita agora, não na primeira leitura dela
+            if offset + length > len(mv):
+                raise ArtefatoInvalidoError(f"{path}: arquivo truncado (seção {name.decode('ascii', 'replace')})")
+            self.sections[name.decode('ascii')] = mv[offset:offset + length]
+
+    def desatualizado(self, base_dir='.'):
+        """True se os arquivos de origem existem e mudaram desde o build."""
+        atual = checksum_fontes(base_dir)
+        return atual is not None and atual != self.checksum
+
+    def tokenizador(self):
+        """Tokenizador usado no build (artefatos sem a seção usavam o NLTK)."""
+        if 'TOKN' not in self.sections:
+            return 'nltk'
+        return bytes(self.sections['TOKN']).decode('ascii')
+
+    def stop_words(self):
+        return set(_read_strings(self.sections['STOP']))
+
+    def intent_index(self):
+        from intent_index import IntentIndex
+        return IntentIndex.from_arrays(
+            tags=_read_strings(self.sections['TAGS']),
+            vocab=_read_strings(self.sections['VOCB']),
+            pattern_tokens=CSR(self.sections['PTOK']),
+            pattern_intent=self.sections['PINT'].cast('I'),
+            postings=CSR(self.sections['POST']))
+
+    def respostas(self):
+        """Tabela tag -> lista de respostas (tag repetida: vale a primeira)."""
+        tags = _read_strings(self.sections['TAGS'])
+        respostas = _read_strings(self.sections['RESP'])
+        tabela = {}
+        for tag, grupo in zip(tags, self._agrupar(respostas, self.sections['RCNT'].cast('I'))):
+            tabela.setdefault(tag, grupo)
+        return tabela
+
+    def vocabulario(self):
+        palavras = _read_strings(self.sections['KWDS'])
+        tags = _read_strings(self.sections['KTAG'])
+        return {
+            'pratos': _read_strings(self.sections['PRAT']),
+            'palavras_chave': dict(zip(tags, self._agrupar(palavras, self.sections['KCNT'].cast('I')))),
+        }
+
+    def intents(self):
+        return json.loads(bytes(self.sections['JSON']))
+
+    @staticmethod
+    def _agrupar(valores, tamanhos):
+        grupos, inicio = [], 0
+        for tamanho in tamanhos:
+            grupos.append(valores[inicio:inicio + tamanho])
+            inicio += tamanho
+        return grupos
+
+
+def carregar_artefato(path, base_dir='.', tokenizador=None):
+    """Abre o artefato se existir e estiver em dia com as fontes (e com o
+    tokenizador configurado, se informado); senão None."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        artefato = ModelArtifact(path)
+    except ArtefatoInvalidoError as e:
+        print(f"Aviso: ignorando artefato do modelo ({e})", file=sys.stderr)
+        return None
+    if artefato.desatualizado(base_dir):
+        print(f"Aviso: {path} está desatualizado em relação ao intents.json/vocabulario.json; "
+              "recompile com 'python model_artifact.py build'", file=sys.stderr)
+        return None
+    if tokenizador is not None and artefato.tokenizador() != tokenizador:
+        print(f"Aviso: {path} foi compilado com o tokenizador {artefato.tokenizador()!r}, "
+              f"mas o configurado é {tokenizador!r}; recompile com 'python model_artifact.py build'",
+              file=sys.stderr)
+        return None
+    return artefato
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compila o modelo do chatbot em um artefato binário')
+    parser.add_argument('comando', choices=['build', 'info'])
+    parser.add_argument('--out', default=os.getenv('MODEL_PATH', 'modelo.bin'))
+    args = parser.parse_args()
+
+    if args.comando == 'build':
+        # Força a compilação a partir do JSON, ignorando um artefato existente
+        os.environ['MODEL_PATH'] = ''
+        from chatbot import chatbot
+        path = compilar(chatbot, args.out)
+        print(f"Artefato gerado: {path} ({os.path.getsize(path)} bytes)")
+    else:
+        artefato = ModelArtifact(args.out)
+        print(f"Versão: {artefato.version}")
+        print(f"SHA-256 das fontes: {artefato.checksum.hex()}")
+        print(f"Tokenizador: {artefato.tokenizador()}")
+        print(f"Desatualizado: {'sim' if artefato.desatualizado() else 'não'}")
+        for name, mv in artefato.sections.items():
+            print(f"  {name}: {len(mv)} bytes")
@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import Counter, OrderedDict
+
+from aho_corasick import AhoCorasick
+from fuzzy import PALAVRA, CorretorOrtografico
+from intent_index import IntentIndex
+
+# Trechos que marcam uma resposta como saudação (evita cumprimentar duas vezes)
+SAUDACOES = ('bem-vindo', 'konnichiwa')
+
+
+def preparar_resposta(texto):
+    """Resposta pré-processada: (texto, palavras, total de palavras, é saudação).
+
+    As palavras alimentam o filtro de respostas parecidas do get_response.
+    """
+    palavras = texto.split()
+    minusculo = texto.lower()
+    return (texto, frozenset(palavras), len(palavras), any(s in minusculo for s in SAUDACOES))
+
+
+class IntentsInvalidosError(ValueError):
+    """O intents.json não passou na validação e foi rejeitado."""
+
+    def __init__(self, erros):
+        super().__init__("; ".join(erros))
+        self.erros = erros
+
+
+def validar_intents(intents, preprocess, strict=False):
+    """Valida o conteúdo do intents.json antes de colocá-lo em produção.
+
+    São erros: estrutura inválida, tags duplicadas, intenções sem respostas
+    (ou com respostas vazias) e intenções em que nenhum padrão sobra após o
+    pré-processamento. Padrões isolados que viram lista vazia (ex: "oi", que
+    tem só 2 letras) são avisos, pois o arquivo atual já tem vários; com
+    strict=True eles também rejeitam o arquivo.
+
+    Retorna a lista de avisos; levanta IntentsInvalidosError se houver erros.
+    """
+    if not isinstance(intents, dict) or not isinstance(intents.get('intents'), list):
+        raise IntentsInvalidosError(["o arquivo deve ter uma lista 'intents'"])
+
+    erros, avisos = [], []
+    tags = set()
+    for posicao, intent in enumerate(intents['intents'], start=1):
+        tag = intent.get('tag') if isinstance(intent, dict) else None
+        if not isinstance(tag, str) or not tag.strip():
+            erros.append(f"intenção #{posicao} sem tag")
+            continue
+        if tag in tags:
+            erros.append(f"tag duplicada: {tag!r}")
+        tags.add(tag)
+
+        patterns = intent.get('patterns')
+        responses = intent.get('responses')
+        if not isinstance(patterns, list) or not patterns:
+            erros.append(f"{tag}: sem padrões")
+            continue
+        if not isinstance(responses, list) or not responses:
+            erros.append(f"{tag}: sem respostas")
+        elif any(not isinstance(r, str) or not r.strip() for r in responses):
+            erros.append(f"{tag}: resposta vazia")
+
+        vazios = [p for p in patterns if not isinstance(p, str) or not preprocess(p)]
+        if len(vazios) == len(patterns):
+            erros.append(f"{tag}: nenhum padrão gera tokens após o pré-processamento")
+        else:
+            avisos.extend(f"{tag}: padrão {p!r} não gera tokens" for p in vazios)
+
+    if strict:
+        erros.extend(avisos)
+    if erros:
+        raise IntentsInvalidosError(erros)
+    return avisos
+
+
+class CacheClassificacao:
+    """Cache LRU mensagem -> classificação das frases, com estatísticas.
+
+    Guarda só o resultado determinístico (intenções, scores e pratos); a
+    escolha da resposta continua aleatória a cada mensagem. Vive no snapshot
+    do modelo, então um recarregamento começa com o cache vazio.
+
+    A chave é a mensagem como chegou (só sem os espaços das pontas): a divisão
+    em frases e a busca de pratos diferenciam maiúsculas e espaços ("E",
+    "hot  roll"), então normalizar mudaria o resultado. Mensagens acima de
+    `max_chars` não entram, o que limita a memória a cerca de
+    max_size x max_chars caracteres por snapshot.
+    """
+
+    def __init__(self, max_size=4096, max_chars=512):
+        self.max_size = max_size
+        self.max_chars = max_chars
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if len(key) > self.max_chars:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'max_chars': self.max_chars,
+        }
+
+
+class Modelo:
+    """Snapshot imutável do modelo compilado (intenções, índice e autômato).
+
+    O chatbot troca o snapshot inteiro de uma vez no recarregamento; quem já
+    estava processando uma mensagem continua com o snapshot antigo.
+    """
+
+    def __init__(self, index, vocabulario, intents=None, artefato=None):
+        self.index = index
+        self.vocabulario = vocabulario
+        self.artefato = artefato
+        self._intents = intents
+        self._respostas = None
+        self._corretor = None
+        self._intents_json = None
+        # Correção de erros de digitação nas frases não reconhecidas (FUZZY=0 desativa)
+        self.fuzzy = os.getenv('FUZZY', '1').lower() not in ('0', 'false', 'nao', 'não')
+        self.build_matcher()
+        # Classificações das mensagens já vistas (CLASSIFICATION_CACHE_SIZE=0 desativa: None)
+        tamanho = int(os.getenv('CLASSIFICATION_CACHE_SIZE', '4096'))
+        self.classificacoes = CacheClassificacao(tamanho) if tamanho > 0 else None
+
+    @classmethod
+    def from_json(cls, intents, vocabulario, preprocess):
+        # Índice compilado dos padrões (tokenizados uma única vez)
+        return cls(IntentIndex(intents, preprocess), vocabulario, intents=intents)
+
+    @classmethod
+    def from_artifact(cls, artefato):
+        return cls(artefato.intent_index(), artefato.vocabulario(), artefato=artefato)
+
+    @property
+    def intents(self):
+        """Intenções do intents.json (lidas do artefato sob demanda)"""
+        if self._intents is None:
+            self._intents = self.artefato.intents()
+        return self._intents
+
+    @property
+    def respostas(self):
+        """tag -> respostas pré-processadas (ver preparar_resposta), montado sob demanda.
+
+        Com o artefato, vem da tabela de respostas dele, sem decodificar o JSON
+        das intenções.
+        """
+        if self._respostas is None:
+            if self._intents is None and self.artefato is not None:
+                tabela = self.artefato.respostas()
+            else:
+                tabela = {}
+                for intent in self.intents['intents']:
+                    # Tag repetida: vale a primeira, como na busca linear
+                    tabela.setdefault(intent['tag'], intent['responses'])
+            self._respostas = {tag: tuple(preparar_resposta(r) for r in respostas)
+                               for tag, respostas in tabela.items()}
+        return self._respostas
+
+    def intents_json(self):
+        """(corpo JSON, ETag) das intenções para o /intents, serializado uma vez por snapshot"""
+        if self._intents_json is None:
+            corpo = json.dumps(self.intents, ensure_ascii=False).encode('utf-8')
+            self._intents_json = (corpo, hashlib.sha1(corpo).hexdigest())
+        return self._intents_json
+
+    @property
+    def corretor(self):
+        """Corretor ortográfico sobre as palavras dos padrões, apelidos e palavras-chave.
+
+        Montado sob demanda (só frases não reconhecidas o usam); None se desativado.
+        """
+        if not self.fuzzy:
+            return None
+        if self._corretor is None:
+            # Peso no desempate: em quantos padrões a palavra aparece
+            frequencias = Counter()
+            for intent in self.intents['intents']:
+                for pattern in intent['patterns']:
+                    frequencias.update(set(PALAVRA.findall(pattern.lower())))
+            for token in self.index.vocab:
+                frequencias[token] += 0
+            termos = list(self.vocabulario['pratos'])
+            for words in self.vocabulario['palavras_chave'].values():
+                termos.extend(words)
+            for termo in termos:
+                frequencias.update(PALAVRA.findall(termo.lower()))
+            self._corretor = CorretorOrtografico(frequencias)
+        return self._corretor
+
+    def build_matcher(self):
+        """Constrói o autômato com os apelidos de pratos e as palavras-chave"""
+        termos = {}
+        for prato in self.vocabulario['pratos']:
+            termos.setdefault(prato, len(termos))
+        for words in self.vocabulario['palavras_chave'].values():
+            for word in words:
+                termos.setdefault(word, len(termos))
+        self.matcher = AhoCorasick(list(termos))
+
+        # Prioridade de cada apelido: mais longo primeiro, depois a ordem da lista
+        self.prato_rank = {}
+        for ordem, prato in enumerate(self.vocabulario['pratos']):
+            self.prato_rank.setdefault(termos[prato], (-len(prato), ordem))
+
+        # Intenções (com repetição) associadas a cada palavra-chave
+        self.keyword_tags = list(self.vocabulario['palavras_chave'])
+        self.keyword_hits = {}
+        for intent_idx, words in enumerate(self.vocabulario['palavras_chave'].values()):
+            for word in words:
+                self.keyword_hits.setdefault(termos[word], []).append(intent_idx)
+
+
+class MonitorArquivos(threading.Thread):
+    """Observa o mtime de arquivos e chama o callback quando algum muda.
+
+    Roda em uma thread daemon; erros do callback (ex: arquivo inválido) são
+    apenas registrados, e o modelo em produção continua o mesmo.
+    """
+
+    def __init__(self, paths, callback, interval=2.0):
+        super().__init__(daemon=True, name='monitor-intents')
+        self.paths = paths
+        self.callback = callback
+        self.interval = interval
+        self._parar = threading.Event()
+        self._mtimes = self._ler_mtimes()
+
+    def _ler_mtimes(self):
+        mtimes = []
+        for path in self.paths:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def run(self):
+        while not self._parar.wait(self.interval):
+            atuais = self._ler_mtimes()
+            if atuais == self._mtimes:
+                continue
+            self._mtimes = atuais
+            try:
+                self.callback()
+                print(f"Recarregado após mudança em {', '.join(self.paths)}", file=sys.stderr)
+            except Exception as e:
+                print(f"Recarregamento rejeitado, mantendo o modelo atual: {e}", file=sys.stderr)
+
+    def parar(self):
+        self._parar.set()
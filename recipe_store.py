@@ -0,0 +1,94 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class RecipeStore:
+    """Armazenamento persistente (SQLite) das receitas consultadas na Gemini.
+
+    Sobrevive a reinícios do servidor: o GeminiClient consulta este arquivo
+    antes de ir à rede. Cada receita tem a data de atualização e, opcionalmente,
+    uma validade própria (max_age) que sobrepõe a validade padrão.
+    """
+
+    def __init__(self, path, max_age=7 * 24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS receitas (
+                    prato TEXT PRIMARY KEY,
+                    receita TEXT NOT NULL,
+                    atualizado_em REAL NOT NULL,
+                    max_age REAL
+                )
+            """)
+
+    def _connect(self):
+        # Uma conexão por thread; o modo WAL permite leituras concorrentes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, prato, incluir_expiradas=False):
+        """Retorna a receita se existir e ainda estiver dentro da validade.
+
+        Com incluir_expiradas=True a validade é ignorada (receita antiga
+        servida quando a API Gemini está fora).
+        """
+        row = self._connect().execute(
+            "SELECT receita, atualizado_em, max_age FROM receitas WHERE prato = ?",
+            (prato,)).fetchone()
+        if row is None:
+            return None
+        receita, atualizado_em, max_age = row
+        validade = self.max_age if max_age is None else max_age
+        if validade is not None and time.time() - atualizado_em > validade and not incluir_expiradas:
+            return None
+        return receita
+
+    def put(self, prato, receita, max_age=None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO receitas (prato, receita, atualizado_em, max_age) VALUES (?, ?, ?, ?)",
+                (prato, receita, time.time(), max_age))
+
+    def set_max_age(self, prato, max_age):
+        """Define a validade de um prato específico (None volta ao padrão)."""
+        with self._connect() as conn:
+            conn.execute("UPDATE receitas SET max_age = ? WHERE prato = ?", (max_age, prato))
+
+    def invalidate(self, prato=None):
+        """Remove a receita de um prato, ou todas quando prato é None."""
+        with self._connect() as conn:
+            if prato is None:
+                cursor = conn.execute("DELETE FROM receitas")
+            else:
+                cursor = conn.execute("DELETE FROM receitas WHERE prato = ?", (prato,))
+            return cursor.rowcount
+
+    def pratos(self):
+        """Lista (prato, idade em segundos) de tudo que está armazenado."""
+        agora = time.time()
+        rows = self._connect().execute(
+            "SELECT prato, atualizado_em FROM receitas ORDER BY prato").fetchall()
+        return [(prato, agora - atualizado_em) for prato, atualizado_em in rows]
+
+
+def store_from_env():
+    """Cria o RecipeStore a partir das variáveis de ambiente.
+
+    RECIPE_STORE_PATH define o arquivo (vazio desativa o armazenamento) e
+    RECIPE_STORE_MAX_AGE a validade padrão em segundos.
+    """
+    path = os.getenv('RECIPE_STORE_PATH', 'receitas.db')
+    if not path:
+        return None
+    max_age = os.getenv('RECIPE_STORE_MAX_AGE')
+    return RecipeStore(path, max_age=float(max_age) if max_age else 7 * 24 * 3600)
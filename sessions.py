@@ -0,0 +1,154 @@
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+# Máximo de pratos guardados no pedido de uma conversa (os mais recentes ficam)
+MAX_ITENS_PEDIDO = int(os.getenv('SESSION_MAX_PEDIDO', '50'))
+
+
+def nova_sessao():
+    """Estado inicial de uma conversa.
+
+    A API key do Gemini não faz parte do estado (ver api_key_da_conversa).
+    """
+    return {
+        'aguardando_selecao': False,   # a lista de pratos foi mostrada e falta a escolha
+        'cumprimentado': False,        # o bot já respondeu a um cumprimento
+        'pedido': [],                  # pratos pedidos até agora
+    }
+
+
+def adicionar_ao_pedido(sessao, pratos):
+    """Acrescenta os pratos ao pedido, mantendo só os MAX_ITENS_PEDIDO mais recentes."""
+    pedido = sessao['pedido']
+    pedido.extend(pratos)
+    del pedido[:-MAX_ITENS_PEDIDO]
+
+
+def _copiar(estado):
+    return {chave: list(valor) if isinstance(valor, list) else valor for chave, valor in estado.items()}
+
+
+class MemorySessionStore:
+    """Sessões em memória com limite de tamanho (LRU) e expiração (TTL).
+
+    Leitura e gravação são O(1): um OrderedDict na ordem do último acesso.
+    As sessões expiradas são removidas ao serem lidas e, na gravação, as do
+    início da fila (as menos usadas) que já expiraram; acima de max_sessions a
+    menos usada é descartada. O estado devolvido é uma cópia, como no Redis:
+    alterações só valem depois do put.
+    """
+
+    def __init__(self, max_sessions=50000, ttl=1800):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessoes = OrderedDict()   # id -> (expira_em, estado)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            item = self._sessoes.get(session_id)
+            if item is None:
+                return None
+            expira_em, estado = item
+            if expira_em < time.monotonic():
+                del self._sessoes[session_id]
+                return None
+            self._sessoes.move_to_end(session_id)
+            return _copiar(estado)
+
+    def put(self, session_id, estado):
+        agora = time.monotonic()
+        with self._lock:
+            self._sessoes[session_id] = (agora + self.ttl, _copiar(estado))
+            self._sessoes.move_to_end(session_id)
+            # Descarta as expiradas do início da fila e o excesso acima do limite
+            while self._sessoes:
+                mais_antiga, (expira_em, _) = next(iter(self._sessoes.items()))
+                if expira_em >= agora and len(self._sessoes) <= self.max_sessions:
+                    break
+                del self._sessoes[mais_antiga]
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessoes.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessoes)
+
+
+class RedisSessionStore:
+    """Sessões em um servidor compatível com Redis, compartilhadas entre workers.
+
+    Recebe qualquer cliente com get/set(ex=)/delete (redis-py ou compatível).
+    A expiração fica a cargo do servidor (TTL renovado a cada gravação) e o
+    limite de memória, da política de eviction configurada nele.
+    """
+
+    def __init__(self, client, ttl=1800, prefix='sessao:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, session_id):
+        dados = self.client.get(self.prefix + session_id)
+        if dados is None:
+            return None
+        return json.loads(dados)
+
+    def put(self, session_id, estado):
+        self.client.set(self.prefix + session_id, json.dumps(estado), ex=int(self.ttl))
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id)
+
+
+def abrir_sessao(store, session_id=None):
+    """Retorna (id, estado) da sessão; cria uma nova se o id não existir."""
+    if session_id and isinstance(session_id, str):
+        estado = store.get(session_id)
+        if estado is not None:
+            estado.pop('api_key', None)   # gravada por versões antigas; não volta para o store
+            return session_id, estado
+    return secrets.token_urlsafe(16), nova_sessao()
+
+
+def api_key_da_conversa(chaves, session_id, informada=None):
+    """API key do Gemini da conversa, guardada só na memória deste processo.
+
+    A chave fica fora do estado da sessão, que pode ir para o Redis: a
+    informada agora é guardada em `chaves` para as próximas mensagens; sem
+    ela, devolve a já guardada (ou None). Com vários workers, um worker que
+    não a recebeu pede a chave de novo.
+    """
+    if informada:
+        chaves.put(session_id, {'api_key': informada})
+        return informada
+    guardada = chaves.get(session_id)
+    return guardada['api_key'] if guardada is not None else None
+
+
+def session_store_from_env():
+    """Cria o armazenamento de sessões a partir das variáveis de ambiente.
+
+    SESSION_REDIS_URL usa um servidor compatível com Redis (requer o pacote
+    redis); sem ela, as sessões ficam em memória, com até SESSION_MAX
+    conversas. SESSION_TTL define a expiração por inatividade, em segundos.
+    """
+    ttl = float(os.getenv('SESSION_TTL', '1800'))
+    redis_url = os.getenv('SESSION_REDIS_URL')
+    if redis_url:
+        import redis
+        return RedisSessionStore(redis.Redis.from_url(redis_url), ttl=ttl)
+    return MemorySessionStore(max_sessions=int(os.getenv('SESSION_MAX', '50000')), ttl=ttl)
+
+
+def chaves_api_from_env():
+    """Armazenamento das API keys por conversa: sempre em memória, com os
+    mesmos SESSION_MAX e SESSION_TTL das sessões."""
+    return MemorySessionStore(max_sessions=int(os.getenv('SESSION_MAX', '50000')),
+                              ttl=float(os.getenv('SESSION_TTL', '1800')))
@@ -69,8 +69,8 @@ const utils = {
 
 const Chatbot = (function() {
     let isOpen = false;
-    let waitingForPlateSelection = false;
-    let apiKey = null;
+    // A seleção de pratos pendente fica na sessão do servidor
+    let sessionId = sessionStorage.getItem('chatbotSessionId');
 
     const toggle = document.getElementById('chatbotToggle');
     const container = document.getElementById('chatbotContainer');
@@ -156,6 +156,36 @@ const Chatbot = (function() {
 
         messagesContainer.appendChild(messageDiv);
         scrollToBottom();
+        return messageDiv;
+    }
+
+    function updateMessage(messageDiv, content) {
+        messageDiv.querySelector('.chatbot-message-content').innerHTML = formatMessage(content);
+        scrollToBottom();
+    }
+
+    async function readEvents(response, onEvent) {
+        // Lê o text/event-stream do /chat/stream: blocos "event: ...\ndata: ..." separados por linha em branco
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let end;
+            while ((end = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, end);
+                buffer = buffer.slice(end + 2);
+                let event = 'message';
+                let data = '';
+                block.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                onEvent(event, data ? JSON.parse(data) : {});
+            }
+        }
     }
 
     function formatMessage(content) {
@@ -188,45 +218,52 @@ const Chatbot = (function() {
         try {
             const payload = { message };
             
-            if (waitingForPlateSelection) {
-                payload.selecao_prato = message;
-                if (apiKey) {
-                    payload.api_key = apiKey;
-                }
+            if (sessionId) {
+                payload.session_id = sessionId;
             }
 
-            const response = await fetch('/chat', {
+            // Stream: a resposta aparece na hora e as receitas chegam em pedaços
+            const response = await fetch('/chat/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(payload)
             });
 
-            const data = await response.json();
-
-            setTimeout(() => {
-                if (response.ok) {
-                    addMessage(data.response, false, data.intent, data.probability);
-                    
-                    if (data.needs_prato_selection) {
-                        waitingForPlateSelection = true;
-                    } else {
-                        waitingForPlateSelection = false;
+            if (response.ok) {
+                const recipes = {};
+                await readEvents(response, (event, data) => {
+                    if (event === 'resultado') {
+                        if (data.response) {
+                            addMessage(data.response, false, data.intent, data.probability);
+                        }
+                        if (data.session_id) {
+                            sessionId = data.session_id;
+                            sessionStorage.setItem('chatbotSessionId', sessionId);
+                        }
+                    } else if (event === 'receita') {
+                        let recipe = recipes[data.prato];
+                        if (!recipe) {
+                            const title = `🍽️ **${data.prato.replace(/\b\w/g, c => c.toUpperCase())}**\n\n`;
+                            recipe = recipes[data.prato] = { title, text: '', div: addMessage(title, false) };
+                        }
+                        recipe.text += data.texto;
+                        updateMessage(recipe.div, recipe.title + recipe.text);
+                    } else if (event === 'erro') {
+                        addMessage('Gomen nasai! Houve um erro no sistema. Por favor, tente novamente.', false);
                     }
-                } else {
-                    addMessage('Gomen nasai! Houve um erro no sistema. Por favor, tente novamente.', false);
-                    waitingForPlateSelection = false;
-                }
+                });
+            } else {
+                addMessage('Gomen nasai! Houve um erro no sistema. Por favor, tente novamente.', false);
+            }
 
-                sendButton.disabled = false;
-                sendButton.innerHTML = '<i class="fas fa-paper-plane" aria-hidden="true"></i>';
-                input.focus();
-            }, 1000);
+            sendButton.disabled = false;
+            sendButton.innerHTML = '<i class="fas fa-paper-plane" aria-hidden="true"></i>';
+            input.focus();
 
         } catch (error) {
             console.error('Error sending message:', error);
             setTimeout(() => {
                 addMessage('Erro de conexão. Verifique sua internet e tente novamente.', false);
-                waitingForPlateSelection = false;
                 sendButton.disabled = false;
                 sendButton.innerHTML = '<i class="fas fa-paper-plane" aria-hidden="true"></i>';
                 input.focus();
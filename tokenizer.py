@@ -0,0 +1,151 @@
+"""Tokenizadores do pré-processamento de texto.
+
+Depois que o preprocess_text remove a pontuação, o texto só tem letras,
+dígitos e espaços; o word_tokenize do NLTK (Punkt + regexes do Treebank) vira
+quase só custo. O tokenizador padrão é um split simples, e o do NLTK continua
+disponível (TOKENIZER=nltk).
+
+    python tokenizer.py paridade     # onde os dois tokenizadores divergem
+    python tokenizer.py bench        # microbenchmark do preprocess_text
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from functools import lru_cache
+
+PONTUACAO = re.compile(r'[^\w\s]')
+
+
+class TokenizadorRegex:
+    """Tokenizador padrão: str.split sobre o texto já sem pontuação."""
+
+    nome = 'regex'
+
+    def tokenize(self, text):
+        return text.split()
+
+
+class TokenizadorNLTK:
+    """Tokenizador original: word_tokenize do NLTK em português."""
+
+    nome = 'nltk'
+
+    def __init__(self):
+        # Importado só quando usado: o NLTK é pesado para importar
+        from nltk.tokenize import word_tokenize
+        self._word_tokenize = word_tokenize
+
+    def tokenize(self, text):
+        return self._word_tokenize(text, language='portuguese')
+
+
+TOKENIZADORES = {
+    'regex': TokenizadorRegex,
+    'nltk': TokenizadorNLTK,
+}
+
+
+def criar_tokenizador(nome=None):
+    """Cria o tokenizador pelo nome (padrão: variável TOKENIZER ou 'regex')."""
+    nome = nome or os.getenv('TOKENIZER', 'regex')
+    if nome not in TOKENIZADORES:
+        raise ValueError(f"Tokenizador desconhecido: {nome!r} (opções: {', '.join(TOKENIZADORES)})")
+    return TOKENIZADORES[nome]()
+
+
+class PreProcessador:
+    """Pipeline do preprocess_text: minúsculas, sem pontuação, tokens,
+    sem stop words e sem palavras com até 2 letras.
+
+    A decisão de manter cada palavra é memorizada, e o resultado por texto
+    fica em um cache LRU (mensagens curtas se repetem muito).
+    """
+
+    def __init__(self, stop_words, tokenizador=None, cache_size=8192, filtro_max=65536):
+        self.stop_words = frozenset(stop_words)
+        self.tokenizador = tokenizador or criar_tokenizador()
+        self._manter = {}
+        self._filtro_max = filtro_max
+        self.processar = lru_cache(maxsize=cache_size)(self._processar)
+
+    def _mantem(self, word):
+        manter = self._manter.get(word)
+        if manter is None:
+            manter = word not in self.stop_words and len(word) > 2
+            if len(self._manter) >= self._filtro_max:
+                self._manter.clear()
+            self._manter[word] = manter
+        return manter
+
+    def _processar(self, text):
+        # Remove pontuação e converte para minúsculo
+        text = PONTUACAO.sub('', text.lower())
+        words = self.tokenizador.tokenize(text)
+        # Remove stop words
+        return tuple(word for word in words if self._mantem(word))
+
+
+def relatorio_paridade(textos, stop_words):
+    """Compara os dois tokenizadores no pipeline completo.
+
+    Retorna (total, lista de (texto, tokens_nltk, tokens_regex) divergentes).
+    """
+    nltk_pp = PreProcessador(stop_words, TokenizadorNLTK())
+    regex_pp = PreProcessador(stop_words, TokenizadorRegex())
+    divergencias = []
+    for texto in textos:
+        a, b = nltk_pp.processar(texto), regex_pp.processar(texto)
+        if a != b:
+            divergencias.append((texto, a, b))
+    return len(textos), divergencias
+
+
+def microbenchmark(textos, stop_words, repeticoes=5):
+    """Mede textos/s do pipeline com cada tokenizador, com e sem o cache LRU."""
+    resultados = {}
+    for nome, classe in TOKENIZADORES.items():
+        for cache in (False, True):
+            pp = PreProcessador(stop_words, classe(), cache_size=8192 if cache else 0)
+            pp.processar(textos[0])   # aquecimento (carga do Punkt etc.)
+            inicio = time.perf_counter()
+            for _ in range(repeticoes):
+                for texto in textos:
+                    pp.processar(texto)
+            decorrido = time.perf_counter() - inicio
+            resultados[f"{nome}{' + cache' if cache else ''}"] = len(textos) * repeticoes / decorrido
+    return resultados
+
+
+def _corpus():
+    with open('intents.json', 'r', encoding='utf-8') as f:
+        intents = json.load(f)
+    textos = [p for intent in intents['intents'] for p in intent['patterns']]
+    textos += [r for intent in intents['intents'] for r in intent['responses']]
+    return textos
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Paridade e desempenho dos tokenizadores')
+    parser.add_argument('comando', choices=['paridade', 'bench'])
+    parser.add_argument('textos', nargs='*', help='textos extras para comparar')
+    args = parser.parse_args()
+
+    os.environ['MODEL_PATH'] = ''
+    from chatbot import chatbot
+    textos = _corpus() + args.textos
+
+    if args.comando == 'paridade':
+        total, divergencias = relatorio_paridade(textos, chatbot.stop_words)
+        print(f"Textos comparados: {total}")
+        print(f"Divergências: {len(divergencias)}")
+        for texto, a, b in divergencias:
+            print(f"- {texto!r}\n    nltk:  {list(a)}\n    regex: {list(b)}")
+        sys.exit(1 if divergencias else 0)
+    else:
+        resultados = microbenchmark(textos, chatbot.stop_words)
+        base = resultados['nltk']
+        for nome, vazao in resultados.items():
+            print(f"{nome:15} {vazao:12.0f} textos/s  ({vazao / base:.1f}x)")
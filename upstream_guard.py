@@ -0,0 +1,324 @@
+"""Proteções das chamadas à API Gemini (o "upstream").
+
+- Limite de taxa por API key (token bucket), só se configurado: cada
+  tentativa de chamada consome uma ficha, inclusive as retentativas, para
+  não estourar a cota;
+- Circuit breaker: depois de várias falhas seguidas as chamadas param por um
+  tempo e o cliente responde na hora (com a receita antiga, se houver);
+  passado esse tempo, uma única chamada de teste decide se o circuito fecha;
+- Retentativas limitadas, com espera exponencial e jitter, só para erros
+  transitórios (timeout, conexão, 429 e 5xx);
+- Prazo por requisição menor que o timeout global: as tentativas e esperas
+  somadas nunca passam dele.
+
+Pedidos simultâneos do mesmo prato já são agrupados pelo single-flight do
+GeminiClient, então só o líder passa por aqui. Verificação com o stub de
+injeção de falhas:
+
+    python upstream_guard.py
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import metricas
+
+# Status HTTP que valem nova tentativa (e contam como falha do upstream)
+STATUS_TRANSITORIOS = frozenset((429, 500, 502, 503, 504))
+
+
+class TokenBucket:
+    """Balde de fichas: `taxa` fichas por segundo, acumulando até `capacidade`."""
+
+    def __init__(self, taxa, capacidade):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.fichas = capacidade
+        self.atualizado_em = time.monotonic()
+
+    def tentar(self, agora):
+        self.fichas = min(self.capacidade, self.fichas + (agora - self.atualizado_em) * self.taxa)
+        self.atualizado_em = agora
+        if self.fichas < 1:
+            return False
+        self.fichas -= 1
+        return True
+
+
+class LimitadorPorChave:
+    """Um TokenBucket por API key, com no máximo `max_chaves` baldes (LRU).
+
+    Uma chave descartada volta com o balde cheio, o que só afrouxa o limite.
+    """
+
+    def __init__(self, taxa=1.0, capacidade=10, max_chaves=10000):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.max_chaves = max_chaves
+        self._baldes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def permitir(self, chave, esperar=False):
+        """True se há ficha para a chave; com esperar=True, aguarda a próxima em vez de recusar."""
+        while True:
+            agora = time.monotonic()
+            with self._lock:
+                balde = self._baldes.get(chave)
+                if balde is None:
+                    balde = self._baldes[chave] = TokenBucket(self.taxa, self.capacidade)
+                    if len(self._baldes) > self.max_chaves:
+                        self._baldes.popitem(last=False)
+                else:
+                    self._baldes.move_to_end(chave)
+                if balde.tentar(agora):
+                    return True
+                if not esperar:
+                    return False
+                falta = (1 - balde.fichas) / balde.taxa
+            time.sleep(falta)
+
+
+class CircuitBreaker:
+    """Circuito fechado -> aberto após `limite_falhas` falhas seguidas.
+
+    Aberto, recusa as chamadas por `reset` segundos; depois deixa passar uma
+    chamada de teste (meio aberto): sucesso fecha o circuito, falha o reabre.
+    Um teste sem resposta não trava o circuito: após outro `reset`, há um novo.
+    """
+
+    FECHADO = 'fechado'
+    ABERTO = 'aberto'
+    MEIO_ABERTO = 'meio_aberto'
+
+    def __init__(self, limite_falhas=5, reset=30.0):
+        self.limite_falhas = limite_falhas
+        self.reset = reset
+        self.estado = self.FECHADO
+        self.falhas = 0
+        self.aberto_em = 0.0
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        with self._lock:
+            if self.estado == self.FECHADO:
+                return True
+            agora = time.monotonic()
+            if agora - self.aberto_em < self.reset:
+                return False
+            # Só a primeira chamada após o reset vira o teste
+            self.estado = self.MEIO_ABERTO
+            self.aberto_em = agora
+            return True
+
+    def sucesso(self):
+        with self._lock:
+            if self.estado != self.FECHADO:
+                metricas.contar('chatbot_gemini_circuito_total', estado=self.FECHADO)
+            self.estado = self.FECHADO
+            self.falhas = 0
+
+    def falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.estado == self.MEIO_ABERTO or self.falhas >= self.limite_falhas:
+                if self.estado != self.ABERTO:
+                    metricas.contar('chatbot_gemini_circuito_total', estado=self.ABERTO)
+                self.estado = self.ABERTO
+                self.aberto_em = time.monotonic()
+
+
+class Prazo:
+    """Tempo restante de uma requisição."""
+
+    def __init__(self, segundos):
+        self.fim = time.monotonic() + segundos
+
+    def restante(self):
+        return max(0.0, self.fim - time.monotonic())
+
+
+class GuardaUpstream:
+    """Limite por API key, circuit breaker, retentativas e prazo, juntos.
+
+    O cliente chama admitir() antes da primeira tentativa e, a cada nova
+    tentativa, espera(); o resultado de cada tentativa é informado com
+    sucesso()/falha(). Sem `taxa`, não há limite de taxa.
+    """
+
+    def __init__(self, taxa=None, capacidade=10, limite_falhas=5, reset=30.0,
+                 max_tentativas=3, espera_base=0.25, espera_max=2.0, prazo=10.0):
+        self.limitador = LimitadorPorChave(taxa, capacidade) if taxa else None
+        self.circuito = CircuitBreaker(limite_falhas, reset)
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.prazo_padrao = prazo
+
+    def prazo(self):
+        return Prazo(self.prazo_padrao)
+
+    def admitir(self, api_key, esperar_limite=False):
+        """None se a chamada pode seguir; senão o motivo da recusa.
+
+        Com esperar_limite=True, sem fichas para a chave a chamada aguarda a
+        próxima em vez de ser recusada (usado pelo pré-aquecimento do cardápio).
+        """
+        # A ficha é tirada antes: um teste do circuito liberado nunca fica sem chamada
+        if self.limitador is not None and not self.limitador.permitir(api_key or '', esperar_limite):
+            metricas.contar('chatbot_gemini_guarda_total', evento='limite_taxa')
+            return 'limite_taxa'
+        if not self.circuito.permitir():
+            metricas.contar('chatbot_gemini_guarda_total', evento='circuito_aberto')
+            return 'circuito_aberto'
+        return None
+
+    def espera(self, tentativa, prazo, api_key):
+        """Segundos a esperar antes da tentativa de número `tentativa` (1, 2, ...).
+
+        None se não há mais tentativas: limite atingido, prazo insuficiente,
+        circuito aberto ou sem fichas para a chave.
+        """
+        if tentativa >= self.max_tentativas:
+            return None
+        # Backoff exponencial com jitter completo
+        espera = random.uniform(0, min(self.espera_max, self.espera_base * 2 ** (tentativa - 1)))
+        if espera >= prazo.restante():
+            metricas.contar('chatbot_gemini_guarda_total', evento='prazo_esgotado')
+            return None
+        if self.admitir(api_key) is not None:
+            return None
+        metricas.contar('chatbot_gemini_guarda_total', evento='retentativa')
+        return espera
+
+    def sucesso(self):
+        self.circuito.sucesso()
+
+    def falha(self):
+        self.circuito.falha()
+
+
+def guarda_from_env():
+    """Cria a GuardaUpstream a partir das variáveis de ambiente.
+
+    GEMINI_RATE_LIMIT (chamadas/s por API key; sem ela, não há limite) e
+    GEMINI_RATE_BURST (rajada), GEMINI_BREAKER_FAILURES e GEMINI_BREAKER_RESET
+    (segundos), GEMINI_MAX_ATTEMPTS (tentativas por prato) e GEMINI_DEADLINE
+    (prazo total em segundos).
+    """
+    taxa = os.getenv('GEMINI_RATE_LIMIT')
+    return GuardaUpstream(
+        taxa=float(taxa) if taxa else None,
+        capacidade=float(os.getenv('GEMINI_RATE_BURST', '10')),
+        limite_falhas=int(os.getenv('GEMINI_BREAKER_FAILURES', '5')),
+        reset=float(os.getenv('GEMINI_BREAKER_RESET', '30')),
+        max_tentativas=int(os.getenv('GEMINI_MAX_ATTEMPTS', '3')),
+        prazo=float(os.getenv('GEMINI_DEADLINE', '10')),
+    )
+
+
+def verificar():
+    """Cenários com o stub de injeção de falhas; retorna o número de falhas."""
+    import asyncio
+
+    from gemini import AsyncGeminiClient, GeminiClient
+    from gemini_stub import start_stub_server
+
+    stub = start_stub_server()
+    resultados = []
+
+    def cliente(**guarda):
+        opcoes = dict(taxa=100.0, capacidade=100, espera_base=0.01, espera_max=0.05)
+        opcoes.update(guarda)
+        return GeminiClient(base_url=stub.base_url, timeout=5, guarda=GuardaUpstream(**opcoes))
+
+    def checar(nome, condicao, detalhe=''):
+        resultados.append(condicao)
+        print(f"{'ok' if condicao else 'FALHOU':7} {nome} {detalhe}")
+
+    try:
+        # 1. Erros transitórios: duas falhas seguidas de sucesso, na mesma consulta
+        stub.chamadas.clear()
+        stub.injetar_falhas(2, status=503)
+        receita = cliente().consultar('temaki', 'k')
+        checar('retentativas', '(stub)' in receita and len(stub.chamadas) == 3,
+               f"({len(stub.chamadas)} chamadas)")
+
+        # 2. Erro 4xx (ex: API key inválida) não é repetido
+        stub.chamadas.clear()
+        stub.injetar_falhas(1, status=400)
+        receita = cliente().consultar('udon', 'k')
+        checar('sem retentativa em 4xx', 'Erro' in receita and len(stub.chamadas) == 1)
+
+        # 3. Circuito abre após as falhas, responde na hora com a receita antiga e fecha depois do reset
+        gemini = cliente(limite_falhas=3, reset=0.5, max_tentativas=1)
+        gemini.cache.ttl = 0
+        gemini.consultar('ramen', 'k')              # receita guardada (já vencida: ttl 0)
+        stub.injetar_falhas(100, status=503)
+        for prato in ('gyoza', 'udon', 'sashimi'):
+            gemini.consultar(prato, 'k')
+        stub.chamadas.clear()
+        inicio = time.perf_counter()
+        receita = gemini.consultar('ramen', 'k')
+        duracao = time.perf_counter() - inicio
+        checar('circuito aberto serve receita antiga',
+               gemini.guarda.circuito.estado == CircuitBreaker.ABERTO and 'Receita salva' in receita
+               and not stub.chamadas, f"({duracao * 1000:.1f} ms)")
+        stub.limpar_falhas()
+        time.sleep(0.6)
+        receita = gemini.consultar('ramen', 'k')
+        checar('circuito fecha após o teste', gemini.guarda.circuito.estado == CircuitBreaker.FECHADO
+               and 'Receita salva' not in receita)
+
+        # 4. Limite por API key: a chave que estourou espera, as outras não
+        gemini = cliente(taxa=0.001, capacidade=2)
+        respostas = gemini.consultar_varios(['temaki', 'udon', 'gyoza'], 'chave-a')
+        outra = gemini.consultar('gyoza', 'chave-b')
+        checar('limite de taxa por chave', sum('Muitas consultas' in r for r in respostas) == 1
+               and '(stub)' in outra)
+
+        # 4b. Com esperar_limite (pré-aquecimento), a chave sem fichas espera em vez de ser recusada
+        gemini = cliente(taxa=20.0, capacidade=2)
+        inicio = time.perf_counter()
+        respostas = gemini.consultar_varios(['temaki', 'udon', 'gyoza', 'ramen'], 'chave-c',
+                                            esperar_limite=True)
+        duracao = time.perf_counter() - inicio
+        checar('limite de taxa com espera', all('(stub)' in r for r in respostas) and duracao >= 0.09,
+               f"({duracao:.2f} s)")
+
+        # 5. Prazo menor que o timeout: upstream lento não prende a requisição
+        stub.injetar_falhas(3, atraso=2.0)
+        gemini = cliente(prazo=0.5)
+        inicio = time.perf_counter()
+        receita = gemini.consultar('tempura', 'k')
+        duracao = time.perf_counter() - inicio
+        stub.limpar_falhas()
+        checar('prazo por requisição', 'Erro' in receita and duracao < 1.0, f"({duracao:.2f} s)")
+
+        # 6. Cliente assíncrono e stream com as mesmas proteções
+        async def assincrono():
+            async_client = AsyncGeminiClient(cliente())
+            try:
+                stub.injetar_falhas(2, status=502)
+                receita = await async_client.consultar('hot roll', 'k')
+                stub.injetar_falhas(1, status=503)
+                pedacos = [t async for t in async_client.consultar_stream('yakissoba', 'k')]
+                return receita, pedacos
+            finally:
+                await async_client.aclose()
+
+        receita, pedacos = asyncio.run(assincrono())
+        checar('assíncrono: retentativas', '(stub)' in receita)
+        checar('assíncrono: stream com retentativa', len(pedacos) > 1 and '(stub)' in pedacos[0])
+    finally:
+        stub.shutdown()
+
+    return resultados.count(False)
+
+
+if __name__ == '__main__':
+    falhas = verificar()
+    print(f"Falhas: {falhas}")
+    sys.exit(1 if falhas else 0)
@@ -0,0 +1,162 @@
+"""Pool de processos para a classificação de intenções.
+
+O predict_intent é Python puro e limitado pelo GIL: mais threads não aumentam
+a vazão. Este pool distribui a classificação entre processos que herdam, via
+fork, o chatbot já compilado (índice de padrões, autômato de pratos etc.).
+Nada é relido ou recompilado nos workers; as páginas de memória são
+compartilhadas em copy-on-write e o gc.freeze() evita que o coletor de lixo
+as toque e force cópias.
+
+Cada chamada envia só as frases (strings) e recebe tuplas pequenas, então o
+custo de despacho é baixo.
+
+No recarregamento das intenções o pool não é recriado (um fork a partir do
+servidor, já com threads, poderia herdar locks presos): o novo snapshot é
+gravado em um artefato temporário e cada chamada leva o caminho do snapshot
+fixado pela requisição; os workers o carregam via mmap na primeira vez.
+
+    CLASSIFY_PROCESSES=16 python app.py
+    python worker_pool.py --max-workers 16     # mede a escalabilidade
+"""
+import argparse
+import gc
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from model_artifact import ModelArtifact, compilar
+from modelo import Modelo
+
+# Chatbot herdado pelos processos filhos no fork (somente leitura)
+_modelo = None
+# Snapshots recarregados depois do fork, nos workers: caminho do artefato -> Modelo
+_snapshots = OrderedDict()
+MAX_SNAPSHOTS = 2
+
+
+def _snapshot(caminho):
+    """Snapshot do artefato (carregado uma vez por worker); None = o herdado no fork."""
+    if caminho is None:
+        return None
+    modelo = _snapshots.get(caminho)
+    if modelo is None:
+        modelo = _snapshots[caminho] = Modelo.from_artifact(ModelArtifact(caminho))
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return modelo
+
+
+def _classificar(sentences, caminho=None):
+    # Fixa o snapshot da requisição (o worker tem uma thread só)
+    _modelo._local.modelo = _snapshot(caminho)
+    try:
+        return [(sentence, *_modelo.predict_intent(sentence), _modelo.extract_prato(sentence))
+                for sentence in sentences]
+    finally:
+        _modelo._local.modelo = None
+
+
+def _pronto(_):
+    return os.getpid()
+
+
+class ClassificadorPool:
+    """Executa a classificação das frases em um pool de processos."""
+
+    def __init__(self, chatbot, workers=None):
+        global _modelo
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("O pool de classificação requer o start method 'fork' (Linux)")
+
+        self.workers = workers or os.cpu_count()
+        self.chatbot = chatbot
+        _modelo = chatbot
+        # Snapshot herdado pelos workers e artefatos dos recarregados depois
+        self._herdado = weakref.ref(chatbot.modelo)
+        self._artefatos = weakref.WeakKeyDictionary()   # Modelo -> caminho
+        self._lock = threading.Lock()
+        # Congela os objetos já criados: o GC não os percorre mais nos filhos,
+        # preservando o compartilhamento copy-on-write das páginas
+        gc.collect()
+        gc.freeze()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context('fork'))
+        # Cria todos os processos agora, antes de o servidor abrir threads
+        list(self.executor.map(_pronto, range(self.workers)))
+
+    def preparar(self, modelo):
+        """Caminho do artefato do snapshot para os workers (None se herdado no fork).
+
+        Compila o artefato na primeira vez; o recarregamento chama antes da
+        troca do modelo, fora do caminho das requisições. O arquivo é apagado
+        quando o snapshot deixa de existir.
+        """
+        if modelo is self._herdado():
+            return None
+        with self._lock:
+            caminho = self._artefatos.get(modelo)
+            if caminho is None:
+                fd, caminho = tempfile.mkstemp(prefix='modelo-', suffix='.bin')
+                os.close(fd)
+                compilar(self.chatbot, caminho, modelo=modelo)
+                self._artefatos[modelo] = caminho
+                weakref.finalize(modelo, _remover, caminho)
+            return caminho
+
+    def classificar(self, sentences, modelo=None):
+        """Retorna (frase, intenção, score, prato) de cada frase, com o snapshot informado."""
+        caminho = self.preparar(modelo) if modelo is not None else None
+        return self.executor.submit(_classificar, sentences, caminho).result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        gc.unfreeze()
+
+
+def _remover(caminho):
+    try:
+        os.unlink(caminho)
+    except OSError:
+        pass
+
+
+def medir_escalabilidade(chatbot, max_workers, repeticoes=4):
+    """Mede a vazão (frases/s) da classificação com 1..max_workers processos.
+
+    A base local executa a mesma tarefa dos workers (_classificar: intenção e
+    prato de cada frase), então a razão é o ganho do pool e nada mais.
+    """
+    global _modelo
+    frases = [p for intent in chatbot.intents['intents'] for p in intent['patterns']] * repeticoes
+    lotes = [frases[i:i + 8] for i in range(0, len(frases), 8)]
+
+    _modelo = chatbot
+    inicio = time.perf_counter()
+    for lote in lotes:
+        _classificar(lote)
+    base = len(frases) / (time.perf_counter() - inicio)
+    print(f"local:       {base:10.0f} frases/s")
+
+    workers = 1
+    while workers <= max_workers:
+        pool = ClassificadorPool(chatbot, workers)
+        inicio = time.perf_counter()
+        list(pool.executor.map(_classificar, lotes, chunksize=4))
+        vazao = len(frases) / (time.perf_counter() - inicio)
+        pool.shutdown()
+        print(f"{workers:2d} processos: {vazao:10.0f} frases/s  ({vazao / base:.1f}x)")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mede a escalabilidade do pool de classificação')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    from chatbot import chatbot
+    medir_escalabilidade(chatbot, args.max_workers)